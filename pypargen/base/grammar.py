@@ -4,13 +4,44 @@
 from pypargen.base.rule import Rule
 
 
+def _mutator(name: str):
+    """Wraps the list method to drop the computed data before changing"""
+    method = getattr(list, name)
+
+    def mutate(self, *args, **kwargs):
+        self._invalidate()
+        return method(self, *args, **kwargs)
+
+    mutate.__name__ = name
+    mutate.__doc__ = method.__doc__
+    return mutate
+
+
 class BaseGrammar(list[Rule]):
-    """Grammar defines a context free grammar. It is simply a list of rules."""
+    """Grammar defines a context free grammar. It is simply a list of rules.
+
+    The symbol tables, rule indexes and the sets computed from the rules
+    (like FIRST) are dropped whenever the rules are changed through the list
+    methods. Changing the RHS list of a rule in place is not detected."""
+
+    append = _mutator("append")
+    extend = _mutator("extend")
+    insert = _mutator("insert")
+    remove = _mutator("remove")
+    pop = _mutator("pop")
+    clear = _mutator("clear")
+    sort = _mutator("sort")
+    reverse = _mutator("reverse")
+    __setitem__ = _mutator("__setitem__")
+    __delitem__ = _mutator("__delitem__")
+    __iadd__ = _mutator("__iadd__")
+    __imul__ = _mutator("__imul__")
 
     def __init__(self, iterable=(), start=None):
         """Create grammar with iterable of rules.
         A rule can either be a tuple of lhs (str) and rhs (list of str)
         or the Rule object."""
+        self._invalidate()
         super().__init__([Rule(*x) for x in iterable])
         assert "__root__" not in self.nonterminals, \
             "__root__ is a reserved nonterminal"
@@ -18,7 +49,6 @@ class BaseGrammar(list[Rule]):
             assert start in self.nonterminals,\
                     "Start symbol must be valid nonterminal"
         self._start = start
-        self._firsts = {('$', ): {'$'}, (): {'ϵ'}}
 
     @property
     def start(self) -> str:
@@ -34,66 +64,178 @@ class BaseGrammar(list[Rule]):
         assert start in self.nonterminals,\
             "Start symbol must be a valid nonterminal"
         self._start = start
+        self._invalidate()
+
+    def _index(self) -> dict:
+        """Builds the symbol tables and rule indexes of the grammar in a
+        single pass over the rules"""
+        if self._indexes is not None:
+            return self._indexes
+
+        terminals = {}
+        rules_by_lhs = {}
+        rule_numbers = {}
+        for num, (lhs, rhs) in enumerate(self):
+            rules_by_lhs.setdefault(lhs, []).append(num)
+            rule_numbers.setdefault((lhs, tuple(rhs)), num)
+            for tok in rhs:
+                if tok.startswith('"'):
+                    terminals[tok] = None
+        self._indexes = {
+            "terminals": list(terminals),
+            "nonterminals": list(rules_by_lhs),
+            "rules_by_lhs": rules_by_lhs,
+            "rule_numbers": rule_numbers,
+        }
+        return self._indexes
 
     @property
     def terminals(self) -> list[str]:
-        """Returns all the terminals found from the grammar"""
-        terms = []
-        for _, rhs in self:
-            for tok in rhs:
-                if tok.startswith('"') and tok not in terms:
-                    terms.append(tok)
-        return terms
+        """Returns all the terminals found from the grammar. The list is
+        shared till the rules change, do not modify it."""
+        return self._index()["terminals"]
 
     @property
     def nonterminals(self) -> list[str]:
-        """Returns all the nonterminals from the grammar"""
-        nonterms = []
-        for lhs, _ in self:
-            if lhs not in nonterms:
-                nonterms.append(lhs)
-        return nonterms
+        """Returns all the nonterminals from the grammar. The list is shared
+        till the rules change, do not modify it."""
+        return self._index()["nonterminals"]
+
+    @property
+    def rules_by_lhs(self) -> dict[str, list[int]]:
+        """Returns the rule numbers for each nonterminal, in the order of
+        rules. Do not modify it."""
+        return self._index()["rules_by_lhs"]
+
+    def rule_number(self, lhs: str, rhs: list[str]) -> int:
+        """Returns the number (index) of the first rule lhs -> rhs. Raises
+        ValueError if there is no such rule."""
+        try:
+            return self._index()["rule_numbers"][(lhs, tuple(rhs))]
+        except KeyError:
+            raise ValueError(f"Rule not in grammar: {Rule(lhs, rhs)}") \
+                from None
 
     def __str__(self) -> str:
         return '\n'.join(map(str, self)) + '\n'
 
+    def _invalidate(self):
+        """Drop everything computed from the rules, called on every change
+        of the rules"""
+        self._analysis = None
+        self._firsts = {}
+        self._indexes = None
+
+    def _analyze(self) -> dict:
+        """Computes NULLABLE, FIRST and FOLLOW of all the nonterminals by
+        fixed-point iteration. The sets of terminals are bitsets (int), bit i
+        being the terminal i in analysis["symbols"]."""
+        if self._analysis is not None:
+            return self._analysis
+
+        nonterminals = self.nonterminals
+        symbols = self.terminals + ['$']
+        ids = {sym: i for i, sym in enumerate(symbols)}
+        nullable = dict.fromkeys(nonterminals, False)
+        firsts = dict.fromkeys(nonterminals, 0)
+        follows = dict.fromkeys(nonterminals, 0)
+        self._analysis = {
+            "symbols": symbols,
+            "ids": ids,
+            "nullable": nullable,
+            "firsts": firsts,
+            "follows": follows,
+        }
+
+        # NULLABLE and FIRST
+        changed = True
+        while changed:
+            changed = False
+            for lhs, rhs in self:
+                first = firsts[lhs]
+                for tok in rhs:
+                    if tok not in nullable:
+                        first |= 1 << self._symbol_id(tok)
+                        break
+                    first |= firsts[tok]
+                    if not nullable[tok]:
+                        break
+                else:
+                    if not nullable[lhs]:
+                        nullable[lhs] = changed = True
+                if first != firsts[lhs]:
+                    firsts[lhs] = first
+                    changed = True
+
+        # FOLLOW
+        follows[self.start] = 1 << ids['$']
+        changed = True
+        while changed:
+            changed = False
+            for lhs, rhs in self:
+                # Walk backwards, carrying FIRST of the rest of the RHS
+                trailer = follows[lhs]
+                for tok in reversed(rhs):
+                    if tok not in nullable:
+                        trailer = 1 << self._symbol_id(tok)
+                        continue
+                    if follows[tok] | trailer != follows[tok]:
+                        follows[tok] |= trailer
+                        changed = True
+                    if nullable[tok]:
+                        trailer |= firsts[tok]
+                    else:
+                        trailer = firsts[tok]
+
+        return self._analysis
+
+    def _symbol_id(self, tok: str) -> int:
+        """Returns the bit position of a terminal. Tokens not found in the
+        grammar (e.g. markers used by parser generators) get new ones."""
+        analysis = self._analyze()
+        if (sid := analysis["ids"].get(tok)) is None:
+            sid = analysis["ids"][tok] = len(analysis["symbols"])
+            analysis["symbols"].append(tok)
+        return sid
+
+    def _tokens(self, bits: int) -> list[str]:
+        """Returns the terminals in the bitset, in their order"""
+        symbols = self._analyze()["symbols"]
+        return [symbols[i] for i in range(bits.bit_length()) if bits >> i & 1]
+
+    def nullable(self, nonterminal: str) -> bool:
+        """Returns True if the nonterminal derives the empty string"""
+        return self._analyze()["nullable"][nonterminal]
+
+    def follow(self, nonterminal: str) -> list[str]:
+        """Returns the follow set of the nonterminal"""
+        return self._tokens(self._analyze()["follows"][nonterminal])
+
     def first(self, tokens: list[str]) -> list[str]:
-        """Returns the first set for a list of tokens"""
+        """Returns the first set for a list of tokens. The terminals are in
+        the order of the grammar terminals, followed by $ and ϵ (if all the
+        tokens can derive the empty string).
+
+        Anything other than the nonterminals (like $) is taken as a
+        terminal, i.e. its own first set."""
         if (ttokens := tuple(tokens)) in self._firsts:
             return self._firsts[ttokens]
 
-        if tokens[0].startswith('"'):
-            firsts = [tokens[0]]
-            # Memoization
-            self._firsts[tuple(tokens)] = firsts
-            return firsts
-
-        firsts = []
-        for lhs, rhs in self:
-            if tokens[0] == lhs:
-                recursive = False
-                # NOTE: Only first RHS token verified
-                if rhs and lhs == rhs[0]:
-                    # Left recursive, check if empty
-                    for lhsi, rhsi in self:
-                        if lhsi == lhs and len(rhsi) <= 0:
-                            recursive = True
-                            break
-                    if not recursive:
-                        # Recursive without epsilon rule
-                        continue
-
-                for f in self.first(rhs[1:] if recursive else rhs):
-                    if f not in firsts:
-                        firsts.append(f)
-
-        if 'ϵ' in firsts:
-            firsts.remove('ϵ')
-            for f in self.first(tokens[1:]):
-                if f not in firsts:
-                    firsts.append(f)
+        analysis = self._analyze()
+        nullable, firsts = analysis["nullable"], analysis["firsts"]
+        first = 0
+        for tok in ttokens:
+            if tok not in nullable:
+                first |= 1 << self._symbol_id(tok)
+                break
+            first |= firsts[tok]
+            if not nullable[tok]:
+                break
+        else:
+            first = self._tokens(first) + ['ϵ']
+            self._firsts[ttokens] = first
+            return first
 
         # Memoization
-        self._firsts[tuple(tokens)] = firsts
-
-        return firsts
+        first = self._firsts[ttokens] = self._tokens(first)
+        return first
@@ -26,6 +26,10 @@ class UnexpectedCharacter(Exception):
 
         super().__init__(msg)
 
+    def __reduce__(self):
+        # Pickled with the arguments, e.g. to raise it from worker processes
+        return type(self), (self.char, self.pos, self.expected)
+
 
 class UnregisteredTerminal(Exception):
     """Exception thrown when an active terminal passed is unregistered"""
@@ -34,6 +38,9 @@ class UnregisteredTerminal(Exception):
         self.terminal = terminal
         super().__init__(f"Unregistered terminal: {self.terminal}")
 
+    def __reduce__(self):
+        return type(self), (self.terminal, )
+
 
 class BaseLexer:
     """BaseLexer is an abstract class for all the lexers
@@ -43,6 +50,7 @@ class BaseLexer:
     lexer = Lexer(terminals, sys.stdin)
     tokens = list(lexer)
     pos = lexer.pos
+    lexer.reset(other_stream)
     ```
     """
     def __init__(self,
@@ -59,6 +67,12 @@ class BaseLexer:
         self.input = inpt
         self.whitespaces = whitespaces
 
+    def reset(self, inpt: io.RawIOBase):
+        """Rebind the lexer to a new input stream, to be lexed from its start
+        with the same terminals. Subclasses override this to also reset their
+        state of the input."""
+        self.input = inpt
+
     def nextToken(self, terminals: Optional[list[str]] = None) -> Token:
         """Override the nextToken method based on the lexer
 
@@ -1,7 +1,12 @@
 # Copyright 2021 Ilango Rajagopal
 # Licensed under GPL-3.0-only
 
-from pypargen.lexer.pyre import PyRELexer
-from pypargen.lexer.lexer import Lexer
+from pypargen.lexer.pyre import PyRELexer, StreamPyRELexer, PushPyRELexer,\
+        MMapLexer
+from pypargen.lexer.lexer import Lexer, PushLexer
+from pypargen.lexer.scanner import ScannerLexer
 
-__all__ = ["PyRELexer", "Lexer"]
+__all__ = [
+    "PyRELexer", "StreamPyRELexer", "PushPyRELexer", "MMapLexer", "Lexer",
+    "PushLexer", "ScannerLexer"
+]
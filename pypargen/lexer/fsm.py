@@ -1,15 +1,22 @@
 # Copyright 2021 Ilango Rajagopal
 # Licensed under GPL-3.0-only
 
+from typing import Iterable, Optional, Union
+import bisect
+import itertools
+import sys
+import threading
+
 
 class NFANode(dict[str, set["NFANode"]]):
-    _next_id = 1
+    # Shared by the threads, next() of a count is atomic
+    _ids = itertools.count(1)
 
     def __new__(cls, token=None, *args, **kwargs):
         node = super().__new__(cls, *args, **kwargs)
-        node._id = cls._next_id
-        cls._next_id += 1
+        node._id = next(cls._ids)
         node.token = token
+        node.ranges = []
         return node
 
     def __init__(self, *args, **kwargs):
@@ -38,6 +45,25 @@ class NFANode(dict[str, set["NFANode"]]):
                 continue
             self[char] = {nxt}
 
+    def add_range_transition(self, first: str, last: str, nxt: "NFANode"):
+        """Add transition on all the characters from first to last (both
+        included), stored as a single range of code points"""
+        assert len(first) == len(last) == 1 and first <= last,\
+                "Range must be of characters in order"
+        if first == last:
+            self.add_transition(first, nxt)
+            return
+        self.ranges.append((ord(first), ord(last), nxt))
+
+    def targets(self, char: str) -> set["NFANode"]:
+        """Returns the nodes to move to on seeing char"""
+        targets = set(self.get(char, ()))
+        code = ord(char)
+        for first, last, nxt in self.ranges:
+            if first <= code <= last:
+                targets.add(nxt)
+        return targets
+
     def __eq__(self, other: "NFANode"):
         return self._id == other._id
 
@@ -58,6 +84,90 @@ class NFA:
         self.end = end
 
 
+class Alphabet:
+    """Alphabet partitions the characters into equivalence classes, the
+    characters on which all the NFA nodes move alike, so that the DFA moves
+    on classes instead of characters. Class 0 is of the characters without
+    any transitions.
+
+    The code points are split into segments at the bounds of the characters
+    and ranges of the transitions. Segments covered by the same characters
+    and ranges are of the same class. Classes of ASCII characters are looked
+    up in a list, others by bisecting the segments."""
+
+    def __init__(self, starts: Iterable[NFANode] = ()):
+        """Partition the characters of the NFA nodes reachable from starts"""
+        nodes = list(dict.fromkeys(starts))
+        seen = set(nodes)
+        for node in nodes:
+            nxts = [nxt for nxts in node.values() for nxt in nxts]
+            nxts += [nxt for _, _, nxt in node.ranges]
+            for nxt in nxts:
+                if nxt not in seen:
+                    seen.add(nxt)
+                    nodes.append(nxt)
+
+        intervals = {(ord(char), ord(char))
+                     for node in nodes for char in node if char}
+        intervals.update(
+            (first, last) for node in nodes for first, last, _ in node.ranges)
+        self.bounds = sorted({0}
+                             | {first for first, _ in intervals}
+                             | {last + 1 for _, last in intervals})
+
+        # Intervals covering each segment
+        covers = [[] for _ in self.bounds]
+        for interval in sorted(intervals):
+            first = bisect.bisect_right(self.bounds, interval[0]) - 1
+            last = bisect.bisect_right(self.bounds, interval[1]) - 1
+            for segment in range(first, last + 1):
+                covers[segment].append(interval)
+        classes = {(): 0}
+        self.ids = [
+            classes.setdefault(tuple(cover), len(classes)) for cover in covers
+        ]
+        self.size = len(classes)
+        self.ascii = [self.classify(chr(code)) for code in range(128)]
+        self._moves: dict[NFANode, dict[int, set[NFANode]]] = {}
+
+    def classify(self, char: str) -> int:
+        """Returns the class of the character"""
+        if (code := ord(char)) < 128 and hasattr(self, "ascii"):
+            return self.ascii[code]
+        return self.ids[bisect.bisect_right(self.bounds, code) - 1]
+
+    def ranges(self, cls: int) -> list[tuple[int, int]]:
+        """Returns the ranges of code points (both ends included) of the
+        class, adjacent ranges merged"""
+        ranges = []
+        for idx, segment in enumerate(self.ids):
+            if segment != cls:
+                continue
+            first = self.bounds[idx]
+            last = self.bounds[idx + 1] - 1 if idx + 1 < len(self.bounds) \
+                else sys.maxunicode
+            if ranges and ranges[-1][1] + 1 == first:
+                ranges[-1] = (ranges[-1][0], last)
+            else:
+                ranges.append((first, last))
+        return ranges
+
+    def moves(self, node: NFANode) -> dict[int, set[NFANode]]:
+        """Returns the nodes the NFA node moves to, by class"""
+        if (moves := self._moves.get(node)) is not None:
+            return moves
+        moves = {}
+        for char, nxts in node.items():
+            if char:
+                moves.setdefault(self.classify(char), set()).update(nxts)
+        for first, last, nxt in node.ranges:
+            begin = bisect.bisect_right(self.bounds, first) - 1
+            end = bisect.bisect_right(self.bounds, last)
+            for cls in set(self.ids[begin:end]):
+                moves.setdefault(cls, set()).add(nxt)
+        return self._moves.setdefault(node, moves)
+
+
 class DFANode(set[NFANode]):
 
     def __init__(self, nfaNodes: set[NFANode]):
@@ -73,11 +183,17 @@ class DFANode(set[NFANode]):
                     self.add(state)
                     stack.insert(0, state)
 
-    def move(self, to: str) -> "DFANode":
+    def move(self,
+             to: Union[str, int],
+             alphabet: Optional[Alphabet] = None) -> "DFANode":
+        """Returns the DFA node to move to on seeing the character to, or
+        the class to of the alphabet, if given"""
         destNodes = set()
         for node in self:
-            if to in node:
-                destNodes.update(node[to])
+            if alphabet is not None:
+                destNodes.update(alphabet.moves(node).get(to, ()))
+            else:
+                destNodes.update(node.targets(to))
         return DFANode(destNodes)
 
     @property
@@ -89,21 +205,192 @@ class DFANode(set[NFANode]):
 
 
 class DFA:
-    def __init__(self, nfa: NFA):
-        self.start = DFANode({nfa.start})
+    """DFA built from the NFA by subset construction. The DFA states are
+    created lazily, only when they are reached.
+
+    The DFA moves on the classes of the alphabet: table holds the
+    transitions of each state by class. The transitions by character are
+    cached in transitions as they are seen, so each character costs a single
+    dict lookup once the DFA has seen it.
+
+    States are represented by integer ids, -1 being the dead state."""
+
+    def __init__(self,
+                 nfa: Optional[NFA] = None,
+                 alphabet: Optional[Alphabet] = None):
+        """Initialize the DFA. The start state is created from the nfa, if
+        passed. Otherwise, create start states with the state method. The
+        alphabet must cover all the NFA nodes of the states, it is made of
+        the nfa if not given."""
+        if alphabet is None:
+            alphabet = Alphabet([nfa.start] if nfa is not None else [])
+        self.alphabet = alphabet
+        self.nodes: list[DFANode] = []
+        self.ids: dict[frozenset[NFANode], int] = {}
+        self.table: list[dict[int, int]] = []
+        self.transitions: list[dict[str, int]] = []
+        self.tokens: list[Union[set[str], bool]] = []
+        self._lock = threading.Lock()
+        if nfa is not None:
+            self.start = self.state({nfa.start})
+
+    def state(self, nfaNodes: set[NFANode]) -> int:
+        """Returns the id of DFA state for the ϵ-closure of nfaNodes"""
+        if not isinstance(nfaNodes, DFANode):
+            nfaNodes = DFANode(nfaNodes)
+        if not nfaNodes:
+            return -1
+        key = frozenset(nfaNodes)
+        if (sid := self.ids.get(key)) is not None:
+            return sid
+        with self._lock:
+            if (sid := self.ids.get(key)) is None:
+                self._append(nfaNodes, nfaNodes.tokens)
+                sid = self.ids[key] = len(self.nodes) - 1
+        return sid
+
+    def _append(self, nfaNodes: DFANode, tokens: Union[set[str], bool]):
+        """Append a state for the NFA nodes"""
+        self.nodes.append(nfaNodes)
+        self.table.append({})
+        self.transitions.append({})
+        self.tokens.append(tokens)
+
+    def move_class(self, state: int, cls: int) -> int:
+        """Returns the state to move to from state on seeing a character of
+        the class"""
+        table = self.table[state]
+        if (nxt := table.get(cls)) is None:
+            nxt = table[cls] = self.state(self.nodes[state].move(
+                cls, self.alphabet))
+        return nxt
+
+    def move(self, state: int, char: str) -> int:
+        """Returns the state to move to from state on seeing char"""
+        transitions = self.transitions[state]
+        if (nxt := transitions.get(char)) is None:
+            nxt = transitions[char] = self.move_class(
+                state, self.alphabet.classify(char))
+        return nxt
+
+    def classes(self, state: int) -> set[int]:
+        """Returns the classes that may move the state to a live state:
+        those of the NFA transitions and the known transitions."""
+        moves = self.alphabet.moves
+        classes = {cls for node in self.nodes[state] for cls in moves(node)}
+        classes.update(self.table[state])
+        return classes
+
+    def explore(self, starts: list[int]) -> list[int]:
+        """Returns the states reachable from starts (themselves included) in
+        breadth first order, creating all of them and their transitions. The
+        DFA is explicit on these states after that."""
+        states = [start for start in dict.fromkeys(starts) if start >= 0]
+        seen = set(states)
+        for state in states:
+            for cls in sorted(self.classes(state)):
+                if (nxt := self.move_class(state, cls)) >= 0 and \
+                        nxt not in seen:
+                    seen.add(nxt)
+                    states.append(nxt)
+        return states
+
+    def minimize(self, starts: list[int]) -> tuple["DFA", list[int]]:
+        """Returns the minimal DFA for the states reachable from starts, with
+        the new ids of starts.
+
+        Hopcroft's algorithm, over the classes of the alphabet: states are
+        first partitioned by their tokens, so the accepting states keep all
+        their terminals and the priority among them can still be chosen.
+        Blocks are then split by the blocks they move to until every block
+        moves as a whole."""
+        states = self.explore(starts)
+        ids = {state: i for i, state in enumerate(states)}
+        dead = len(states)
+        classes = sorted({
+            cls
+            for state in states for cls, nxt in self.table[state].items()
+            if nxt >= 0
+        })
+
+        # Transitions inverted per class, the dead state included
+        inverse = {cls: [[] for _ in range(dead + 1)] for cls in classes}
+        for state in states:
+            table = self.table[state]
+            for cls in classes:
+                nxt = table.get(cls, -1)
+                inverse[cls][ids[nxt] if nxt >= 0 else dead].append(ids[state])
+        for cls in classes:
+            inverse[cls][dead].append(dead)
+
+        labels = {}
+        for state in states:
+            tokens = frozenset(self.tokens[state] or ())
+            labels.setdefault(tokens, []).append(ids[state])
+        labels.setdefault(frozenset(), []).append(dead)
+        blocks = [set(block) for block in labels.values()]
+        block_of = [0] * (dead + 1)
+        for idx, block in enumerate(blocks):
+            for state in block:
+                block_of[state] = idx
+
+        work = {(idx, cls) for idx in range(len(blocks)) for cls in classes}
+        while work:
+            idx, cls = work.pop()
+            movers = {src for dst in blocks[idx] for src in inverse[cls][dst]}
+
+            # Split the blocks partially moving into the splitter
+            split = {}
+            for state in movers:
+                split.setdefault(block_of[state], set()).add(state)
+            for old, part in split.items():
+                if len(part) == len(blocks[old]):
+                    continue
+                blocks[old] -= part
+                new = len(blocks)
+                blocks.append(part)
+                for state in part:
+                    block_of[state] = new
+                for cls2 in classes:
+                    if (old, cls2) in work or \
+                            len(part) <= len(blocks[old]):
+                        work.add((new, cls2))
+                    else:
+                        work.add((old, cls2))
+
+        # Number the live blocks in the order of the states. The states have
+        # no NFA nodes, so they never move on classes not in the table.
+        minimal = DFA(alphabet=self.alphabet)
+        numbers = {block_of[dead]: -1}
+        for state in states:
+            if (block := block_of[ids[state]]) not in numbers:
+                numbers[block] = len(minimal.nodes)
+                minimal._append(DFANode(set()), self.tokens[state])
+        for state in states:
+            # States that never accept are merged into the dead state
+            if (number := numbers[block_of[ids[state]]]) < 0:
+                continue
+            table = minimal.table[number]
+            for cls, nxt in self.table[state].items():
+                if nxt >= 0 and (nxt := numbers[block_of[ids[nxt]]]) >= 0:
+                    table[cls] = nxt
+        return minimal, [
+            numbers[block_of[ids[start]]] if start >= 0 else -1
+            for start in starts
+        ]
 
     def match(self, string: str) -> tuple[int, str]:
         state = self.start
         i = 0
         for i, c in enumerate(string):
-            nstate = state.move(c)
-            if not nstate:
+            nstate = self.move(state, c)
+            if nstate < 0:
                 break
             state = nstate
         else:
             i += 1
         if len(string) == 0:
             i = 0
-        if state.tokens:
-            return (state.tokens, i)
+        if state >= 0 and self.tokens[state]:
+            return (self.tokens[state], i)
         return False
@@ -1,8 +1,12 @@
 # Copyright 2021 Ilango Rajagopal
 # Licensed under GPL-3.0-only
 
+from collections import OrderedDict
+import codecs
+import functools
+from typing import NamedTuple, Optional, Union
 import io
-from typing import Optional
+import threading
 
 from pypargen.base.lexer import BaseLexer, UnexpectedCharacter,\
         UnregisteredTerminal
@@ -10,37 +14,174 @@ from pypargen.base.token import Token
 from pypargen.lexer import fsm, re
 
 
+class CacheInfo(NamedTuple):
+    """Statistics of the start state cache, like functools.lru_cache"""
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+
+@functools.lru_cache(maxsize=1024)
+def terminal_nfa(term: str) -> fsm.NFA:
+    """Returns the NFA of the terminal, its end node holding the terminal as
+    token. The NFAs are cached by the terminal, shared by all the automata,
+    and must not be modified."""
+    nfa = re.parser().parse(term[1:-1])
+    nfa.end.token = term
+    return nfa
+
+
+class Automaton:
+    """Automaton holds the NFAs of a list of terminals and the DFA built over
+    them. It is shared by all the lexers with the same terminals, so are the
+    DFA states and transitions found by any of them.
+
+    The start DFA state for each set of active terminals is cached, with
+    least recently used sets evicted beyond maxstarts."""
+
+    def __init__(self, terminals: list[str], maxstarts: int = 256):
+        """Build the NFA's of the terminals and combine them in a DFA"""
+        self.terminals = terminals.copy()
+        self.nfa_starts: dict[str, fsm.NFANode] = {}
+        for term in self.terminals:
+            self.nfa_starts[term] = terminal_nfa(term).start
+        self.dfa = fsm.DFA(alphabet=fsm.Alphabet(self.nfa_starts.values()))
+
+        self.maxstarts = maxstarts
+        self.hits = 0
+        self.misses = 0
+        self._starts: OrderedDict[frozenset[str], int] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def start(self, terminals: list[str]) -> int:
+        """Returns the start DFA state to look for the terminals. Raises
+        UnregisteredTerminal if any of the terminals is not known."""
+        key = frozenset(terminals)
+        with self._lock:
+            if (state := self._starts.get(key)) is not None:
+                self._starts.move_to_end(key)
+                self.hits += 1
+                return state
+
+        for term in terminals:
+            if term not in self.nfa_starts:
+                raise UnregisteredTerminal(term)
+        state = self.dfa.state({self.nfa_starts[term] for term in terminals})
+
+        with self._lock:
+            self.misses += 1
+            self._starts[key] = state
+            if len(self._starts) > self.maxstarts:
+                self._starts.popitem(last=False)
+        return state
+
+    def explore(self, start: int) -> list[int]:
+        """Returns the DFA states reachable from start (itself included),
+        creating all of them. See DFA.explore."""
+        return self.dfa.explore([start])
+
+    def cache_info(self) -> CacheInfo:
+        """Returns the hit/miss statistics of the start state cache"""
+        return CacheInfo(self.hits, self.misses, self.maxstarts,
+                         len(self._starts))
+
+
+@functools.lru_cache(maxsize=256)
+def _automaton(terminals: tuple[str, ...]) -> Automaton:
+    return Automaton(list(terminals))
+
+
+def automaton(terminals: list[str]) -> Automaton:
+    """Returns the automaton for the terminals, building it only if no lexer
+    has built it yet. Automata of the least recently used terminals are
+    evicted beyond 256 (see _automaton.cache_info())."""
+    return _automaton(tuple(terminals))
+
+
 class Lexer(BaseLexer):
-    """Lexer built with RE parser and FSM library right inside pypargen."""
+    """Lexer built with RE parser and FSM library right inside pypargen.
+
+    The input is read in chunks of bufsize characters (or bytes, for binary
+    streams, which are decoded as UTF-8) and scanned by index. Tokens may
+    span across the chunks."""
+
+    bufsize = io.DEFAULT_BUFFER_SIZE * 8
 
     def __init__(self,
                  terminals: list[str],
                  inpt: io.RawIOBase,
-                 whitespaces: Optional[str] = None):
-        """Initiallize the lexer. Similar to base initialization arguments."""
+                 whitespaces: Optional[str] = None,
+                 bufsize: Optional[int] = None):
+        """Initiallize the lexer. Similar to base initialization arguments,
+        bufsize overrides the size of chunks read from the input."""
         super().__init__(terminals, inpt, whitespaces)
         if self.whitespaces:
             self.whitespaces = list(self.whitespaces)
         else:
             self.whitespaces = []
-        self._re_parser = re.REParser()
-        self.nfa_starts = {}
-
-        # Build the NFA's and combine them
-        for term in self.terminals:
-            nfa = self._re_parser.parse(term[1:-1])
-            nfa.end.token = term
-            self.nfa_starts[term] = nfa.start
+        if bufsize is not None:
+            assert bufsize > 0, "Buffer size must be positive"
+            self.bufsize = bufsize
+        self.automaton = automaton(self.terminals)
+        self.nfa_starts = self.automaton.nfa_starts
+        self.dfa = self.automaton.dfa
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self.reset(inpt)
 
+    def reset(self, inpt: io.RawIOBase):
+        """Rebind the lexer to a new input stream, keeping the automaton"""
+        super().reset(inpt)
         self.stopped = False
-        self.pos = 0
-        self.next_char()
+        self._decoder.reset()
+        self.offset = 0
+        self.chunk = ''
+        self.idx = 0
+        self.fill()
+
+    def fill(self) -> bool:
+        """Replace the current chunk by the next chunk of the input. Returns
+        False if the input has ended."""
+        self.offset += len(self.chunk)
+        self.chunk = ''
+        self.idx = 0
+        while not self.chunk:
+            data = self.input.read(self.bufsize)
+            if not isinstance(data, str):
+                final = not data
+                self.chunk = self._decoder.decode(data or b'', final)
+                if final:
+                    break
+            elif not data:
+                break
+            else:
+                self.chunk = data
+        return bool(self.chunk)
 
-    def next_char(self):
-        self.buf = self.input.read(1)
-        self.pos += len(self.buf)
-        if hasattr(self.buf, 'decode'):
-            self.buf = self.buf.decode()
+    @property
+    def buf(self) -> str:
+        """Returns the current character, empty at the end of input"""
+        return self.chunk[self.idx:self.idx + 1]
+
+    @property
+    def pos(self) -> int:
+        """Returns the number of characters read till the current one"""
+        return self.offset + self.idx + len(self.buf)
+
+    def skip(self) -> bool:
+        """Skip the whitespaces, reading chunks as needed. Returns False if
+        the input has ended."""
+        whitespaces = self.whitespaces
+        chunk, idx = self.chunk, self.idx
+        while True:
+            while idx < len(chunk) and chunk[idx] in whitespaces:
+                idx += 1
+            if idx < len(chunk):
+                self.idx = idx
+                return True
+            if not self.fill():
+                return False
+            chunk, idx = self.chunk, 0
 
     def nextToken(self, terminals: Optional[list[str]] = None) -> Token:
         """Request next token from the Lexer. Pass optional terminals to look
@@ -48,43 +189,165 @@ class Lexer(BaseLexer):
         if self.stopped:
             raise StopIteration
 
-        # First, skip whitespaces
-        while self.buf in self.whitespaces:
-            self.next_char()
-
-        if self.buf == '':
+        if not self.skip():
             self.stopped = True
             return Token('$', None)
+        chunk, idx = self.chunk, self.idx
 
         if terminals is None:
             terminals = self.terminals
-        else:
-            for term in terminals:
-                if term not in self.terminals:
-                    raise UnregisteredTerminal(term)
 
-        state = fsm.DFANode({self.nfa_starts[term] for term in terminals})
+        dfa = self.dfa
+        transitions = dfa.transitions
+        state = self.automaton.start(terminals)
+        if state < 0:
+            raise UnexpectedCharacter(self.buf, self.pos, terminals)
+
         content = ''
+        begin = idx
+        while True:
+            if idx == len(chunk):
+                # Token continues in the next chunk
+                content += chunk[begin:]
+                self.idx = idx
+                self.fill()
+                chunk, begin, idx = self.chunk, 0, 0
+                if not chunk:
+                    break
 
-        while self.buf != '':
-            nstate = state.move(self.buf)
-            if not nstate:
+            if (nstate := transitions[state].get(chunk[idx])) is None:
+                nstate = dfa.move(state, chunk[idx])
+            if nstate < 0:
                 break
 
             # Next state
             state = nstate
-            content += self.buf
+            idx += 1
+        content += chunk[begin:idx]
+        self.idx = idx
 
-            # Read next
-            self.next_char()
-
-        if not state.tokens:
+        if not (tokens := dfa.tokens[state]):
             raise UnexpectedCharacter(self.buf, self.pos, terminals)
 
         for term in terminals:
-            if term in state.tokens:
+            if term in tokens:
                 break
         else:
             raise UnexpectedCharacter(self.buf, self.pos, terminals)
 
         return Token(term, content)
+
+
+class PushLexer(Lexer):
+    """Lexer fed with the input in chunks (str, or bytes decoded as UTF-8)
+    instead of reading it from a stream:
+    ```
+    lexer = PushLexer(terminals, " ")
+    lexer.feed("12 a")
+    lexer.nextToken()  # Token for "12"
+    lexer.nextToken()  # None, "a" may continue in the next chunk
+    lexer.feed("bc")
+    lexer.close()
+    lexer.nextToken()  # Token for "abc"
+    ```
+    nextToken returns None when the token cannot be known without more
+    input. The scan of a token left at the end of the fed input is suspended
+    with its DFA state and resumed on the next chunk, so long tokens fed in
+    small chunks are scanned only once. Consumed input is discarded."""
+
+    def __init__(self,
+                 terminals: list[str],
+                 whitespaces: Optional[str] = None):
+        """Initialize the lexer with the terminals to look for"""
+        super().__init__(terminals, None, whitespaces)
+
+    def reset(self, inpt: Union[str, bytes, None] = None):
+        """Discard the input fed so far and start a new input, fed with inpt
+        first if given"""
+        self.input = None
+        self.stopped = False
+        self.closed = False
+        self._decoder.reset()
+        self.offset = 0
+        self.chunk = ''
+        self.idx = 0
+        # Start of the token being scanned, its DFA state and scan index
+        self._begin = 0
+        self._state: Optional[int] = None
+        self._scan = 0
+        if inpt:
+            self.feed(inpt)
+
+    def feed(self, data: Union[str, bytes]):
+        """Feed the next chunk of the input"""
+        assert not self.closed, "Input is closed"
+        if not isinstance(data, str):
+            data = self._decoder.decode(data)
+        # Keep the text from the start of the token being scanned
+        keep = self._begin if self._state is not None else self.idx
+        self.chunk = self.chunk[keep:] + data
+        self.offset += keep
+        self.idx -= keep
+        self._begin -= keep
+        self._scan -= keep
+
+    def close(self):
+        """Mark the end of the input"""
+        if not self.closed:
+            self.chunk += self._decoder.decode(b'', True)
+            self.closed = True
+
+    def fill(self) -> bool:
+        """Input is only fed"""
+        return False
+
+    def nextToken(self,
+                  terminals: Optional[list[str]] = None) -> Optional[Token]:
+        """Request next token from the Lexer, None if more input is needed.
+        Pass optional terminals to look for only these terminals."""
+        if self.stopped:
+            raise StopIteration
+        if terminals is None:
+            terminals = self.terminals
+        chunk = self.chunk
+
+        if (state := self._state) is None:
+            idx = self.idx
+            whitespaces = self.whitespaces
+            while idx < len(chunk) and chunk[idx] in whitespaces:
+                idx += 1
+            self.idx = idx
+            if idx == len(chunk):
+                if not self.closed:
+                    return None
+                self.stopped = True
+                return Token('$', None)
+            if (state := self.automaton.start(terminals)) < 0:
+                raise UnexpectedCharacter(self.buf, self.pos, terminals)
+            self._begin = idx
+        else:
+            idx = self._scan
+
+        dfa = self.dfa
+        transitions = dfa.transitions
+        while idx < len(chunk):
+            if (nstate := transitions[state].get(chunk[idx])) is None:
+                nstate = dfa.move(state, chunk[idx])
+            if nstate < 0:
+                break
+            state = nstate
+            idx += 1
+        else:
+            if not self.closed:
+                # Token may continue in the next chunk
+                self._state, self._scan = state, idx
+                return None
+
+        self._state = None
+        content = chunk[self._begin:idx]
+        self.idx = idx
+        if tokens := dfa.tokens[state]:
+            for term in terminals:
+                if term in tokens:
+                    return Token(term, content)
+        raise UnexpectedCharacter(self.buf, self.pos, terminals)
@@ -1,60 +1,273 @@
 # Copyright 2021 Ilango Rajagopal
 # Licensed under GPL-3.0-only
 
-from typing import Optional
-import re
+from typing import Optional, Union
+import codecs
+import functools
 import io
+import mmap
+import re
 
 from pypargen.base.token import Token
 from pypargen.base.lexer import BaseLexer, UnexpectedCharacter,\
         UnregisteredTerminal
 
 
+# References to groups in a pattern: numbered and named backreferences and
+# conditionals. Look-alikes (e.g. octal escapes) only keep the terminals
+# from being combined.
+_GROUP_REFERENCE = re.compile(r"\\[1-9]|\(\?P=|\(\?\(")
+
+
+@functools.lru_cache(maxsize=256)
+def master_pattern(
+    terminals: tuple[str, ...],
+    binary: bool = False
+) -> tuple[Optional[re.Pattern], dict[str, str]]:
+    """Combine the terminals into a single pattern, an alternation of named
+    groups in the order of terminals. As the first alternative that matches
+    is taken, the priority of terminals is preserved. If binary, the pattern
+    is compiled to match bytes (UTF-8).
+
+    Returns the pattern and the terminal for each group name. The pattern is
+    None if the terminals cannot be combined: they use global flags, or
+    refer to their own groups, which are numbered differently once wrapped
+    in the groups of the terminals."""
+    for patt in terminals:
+        if _GROUP_REFERENCE.search(patt[1:-1]):
+            return None, {}
+    groups = {f"t{i}": patt for i, patt in enumerate(terminals)}
+    pattern = '|'.join(f"(?P<{name}>{patt[1:-1]})"
+                       for name, patt in groups.items())
+    try:
+        pattern = re.compile(pattern.encode() if binary else pattern)
+    except re.error:
+        pattern = None
+    return pattern, groups
+
+
 class PyRELexer(BaseLexer):
-    """Lexical tokenizer based on re library."""
+    """Lexical tokenizer based on re library.
+
+    By default, the whole input is read before matching. If bufsize is set,
+    the input is streamed instead: a window of the input is kept, with at
+    least bufsize characters after the current position when available. The
+    window is extended whenever a match reaches its end (so that the longest
+    match is still found) and consumed text is discarded, keeping the memory
+    bounded. Patterns that need more than bufsize characters of lookahead to
+    fail are not supported in that mode."""
+
+    bufsize: Optional[int] = None
+    binary = False
 
     def __init__(self,
                  terminals: list[str],
                  inpt: io.RawIOBase,
-                 whitespaces: Optional[str] = None):
-        """Initialize lexer with terminals to be looked for and input stream"""
+                 whitespaces: Optional[str] = None,
+                 bufsize: Optional[int] = None):
+        """Initialize lexer with terminals to be looked for and input stream.
+        bufsize overrides the streaming window size (see help(PyRELexer))."""
         super().__init__(terminals, inpt, whitespaces)
-        self._patterns = {patt: re.compile(patt[1:-1]) for patt in terminals}
+        self._patterns = {patt: self.compile(patt[1:-1]) for patt in terminals}
+        self._masters = {}
 
-        self.ws_pattern = re.compile("")
+        self.ws_pattern = self.compile("")
         if self.whitespaces:
-            self.ws_pattern = re.compile(f"[{self.whitespaces}]*")
+            self.ws_pattern = self.compile(f"[{self.whitespaces}]*")
 
-        # Read the whole input (No other way to use re)
-        self.str = inpt.read()
-        if hasattr(self.str, "decode"):
-            self.str = self.str.decode()
-        self.pos = 0
+        if bufsize is not None:
+            assert bufsize > 0, "Buffer size must be positive"
+            self.bufsize = bufsize
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self.reset(inpt)
+
+    def reset(self, inpt: io.RawIOBase):
+        """Rebind the lexer to a new input stream, keeping the compiled
+        patterns"""
+        super().reset(inpt)
+        self._decoder.reset()
+        self.str = ''
+        self.idx = 0
+        self.offset = 0
+        self.eof = False
+        self.read(self.bufsize or -1)
         self.stopped = False
 
-    def nextToken(self, terminals: Optional[list[str]] = None) -> Token:
-        if self.stopped:
-            raise StopIteration
+    @property
+    def pos(self) -> int:
+        """Returns the position of the lexer in the input"""
+        return self.offset + self.idx
 
-        # First, skip whitespaces
-        if ws := self.ws_pattern.match(self.str, self.pos):
-            self.pos = ws.end()
+    def compile(self, pattern: str) -> re.Pattern:
+        """Compile the pattern to match the input"""
+        return re.compile(pattern)
 
-        # Generate the last token as $
-        if self.pos >= len(self.str):
-            self.stopped = True
-            return Token('$', None)
+    def content(self, match: re.Match) -> any:
+        """Returns the content of token from its match"""
+        return match.group(0)
+
+    def read(self, size: int = -1) -> bool:
+        """Read size characters from input into the window, discarding the
+        consumed text. Reads the whole input if size is negative. Returns
+        False if the input cannot be read yet (see PushPyRELexer)."""
+        data = raw = self.input.read(size)
+        if not isinstance(raw, str):
+            data = self._decoder.decode(raw or b'', not raw)
+        if size < 0 or not raw:
+            self.eof = True
+
+        self.str = self.str[self.idx:] + data
+        self.offset += self.idx
+        self.idx = 0
+        return True
+
+    def nextToken(self,
+                  terminals: Optional[list[str]] = None) -> Optional[Token]:
+        """Request next token from the lexer, None if more input is needed
+        and cannot be read yet. Pass optional terminals to look for only
+        these terminals."""
+        if self.stopped:
+            raise StopIteration
 
         # Check for active patterns
         if not terminals:
             terminals = self.terminals
 
-        # Passing terminals changes "active" terminals to look for
-        for patt in terminals:
-            if patt not in self.terminals:
-                raise UnregisteredTerminal(patt)
-            if match := self._patterns[patt].match(self.str, self.pos):
-                term = match.group(0)
-                self.pos += len(term)
-                return Token(patt, term)
-        raise UnexpectedCharacter(self.str[self.pos], self.pos, terminals)
+        while True:
+            # First, skip whitespaces
+            if ws := self.ws_pattern.match(self.str, self.idx):
+                if ws.end() == len(self.str) and not self.eof:
+                    if not self.read(self.bufsize):
+                        return None
+                    continue
+                self.idx = ws.end()
+
+            # Keep bufsize characters of lookahead
+            if not self.eof and len(self.str) - self.idx < self.bufsize:
+                if not self.read(self.bufsize):
+                    return None
+                continue
+
+            # Generate the last token as $
+            if self.idx >= len(self.str):
+                self.stopped = True
+                return Token('$', None)
+
+            # Passing terminals changes "active" terminals to look for
+            if (master := self._masters.get(key := tuple(terminals))) is None:
+                for patt in terminals:
+                    if patt not in self.terminals:
+                        raise UnregisteredTerminal(patt)
+                master = self._masters[key] = master_pattern(key, self.binary)
+
+            pattern, groups = master
+            if pattern is not None:
+                if match := pattern.match(self.str, self.idx):
+                    patt = groups[match.lastgroup]
+            else:
+                # Patterns could not be combined, try them one by one
+                for patt in terminals:
+                    if match := self._patterns[patt].match(
+                            self.str, self.idx):
+                        break
+            if not match:
+                raise UnexpectedCharacter(self.str[self.idx:self.idx + 1],
+                                          self.pos, terminals)
+
+            # Match may continue beyond the window
+            if match.end() == len(self.str) and not self.eof:
+                if not self.read(self.bufsize):
+                    return None
+                continue
+
+            self.idx = match.end()
+            return Token(patt, self.content(match))
+
+
+class StreamPyRELexer(PyRELexer):
+    """PyRELexer streaming the input in a window of 64K characters"""
+
+    bufsize = io.DEFAULT_BUFFER_SIZE * 8
+
+
+class PushPyRELexer(StreamPyRELexer):
+    """PyRELexer fed with the input in chunks (str, or bytes decoded as
+    UTF-8) instead of reading it from a stream, like PushLexer. The fed
+    input is kept in the window of StreamPyRELexer: nextToken returns None
+    till the window holds bufsize characters after the token (or the input
+    is closed), so that the longest match is found."""
+
+    def __init__(self,
+                 terminals: list[str],
+                 whitespaces: Optional[str] = None,
+                 bufsize: Optional[int] = None):
+        """Initialize the lexer with the terminals to look for"""
+        super().__init__(terminals, None, whitespaces, bufsize)
+
+    def reset(self, inpt: Union[str, bytes, None] = None):
+        """Discard the input fed so far and start a new input, fed with inpt
+        first if given"""
+        super().reset(None)
+        if inpt:
+            self.feed(inpt)
+
+    def read(self, size: int = -1) -> bool:
+        """Input is only fed"""
+        return False
+
+    def feed(self, data: Union[str, bytes]):
+        """Feed the next chunk of the input"""
+        assert not self.eof, "Input is closed"
+        if not isinstance(data, str):
+            data = self._decoder.decode(data)
+        self.str = self.str[self.idx:] + data
+        self.offset += self.idx
+        self.idx = 0
+
+    def close(self):
+        """Mark the end of the input"""
+        if not self.eof:
+            self.str += self._decoder.decode(b'', True)
+            self.eof = True
+
+
+class MMapLexer(PyRELexer):
+    """PyRELexer matching directly over a memory mapped file (or any bytes
+    like object), without reading it into memory.
+
+    The terminals are compiled as bytes patterns (UTF-8), so they should
+    only use ASCII characters in character classes and pos counts bytes.
+    Token contents are decoded to str, or if decode is False, given as
+    memoryview slices of the mapping, copying nothing."""
+
+    binary = True
+
+    def __init__(self,
+                 terminals: list[str],
+                 inpt: Union[mmap.mmap, bytes],
+                 whitespaces: Optional[str] = None,
+                 decode: bool = True):
+        """Initialize lexer with terminals to be looked for and the mapping"""
+        self.decode = decode
+        super().__init__(terminals, inpt, whitespaces)
+
+    def reset(self, inpt: Union[mmap.mmap, bytes]):
+        """Rebind the lexer to a new mapping"""
+        self._view = None if self.decode else memoryview(inpt)
+        super().reset(inpt)
+
+    def compile(self, pattern: str) -> re.Pattern:
+        """Compile the pattern to match bytes"""
+        return re.compile(pattern.encode())
+
+    def read(self, size: int = -1) -> bool:
+        """The whole mapping is always available"""
+        self.str = self.input
+        self.eof = True
+        return True
+
+    def content(self, match: re.Match) -> Union[str, memoryview]:
+        """Returns the decoded content or a view of the mapping"""
+        if self.decode:
+            return match.group(0).decode()
+        return self._view[match.start():match.end()]
@@ -7,7 +7,9 @@ performant regular expression engine for Lexer purposes, though this module
 can be used for regular expressions compilation and matching
 """
 
+from typing import Optional
 import io
+import threading
 
 from pypargen.base.lexer import BaseLexer
 from pypargen.grm.grammar import rules
@@ -22,10 +24,10 @@ def nop(a: any):
 callbacks = [nop]
 
 
-def rng(chr_rng: str) -> str:
+def rng(chr_rng: str) -> list[tuple[str, str]]:
     frm, _, to = chr_rng
     assert frm <= to, "Range item invalid"
-    return ''.join(map(chr, range(ord(frm), ord(to) + 1)))
+    return [(frm, to)]
 
 
 callbacks += [rng] * 3
@@ -45,12 +47,18 @@ def char(char: str, esc_char: str = None) -> str:
 
 callbacks += [char] * 2
 
+
 # sqc -> rng | chr
-callbacks += [nop] * 2
+def char_range(char: str) -> list[tuple[str, str]]:
+    return [(char, char)]
+
 
+callbacks += [nop, char_range]
 
-def sqs(sqs: str, sqc: str = ''):
-    return sqs + sqc
+
+def sqs(sqs: list[tuple[str, str]],
+        sqc: Optional[list[tuple[str, str]]] = None):
+    return sqs + (sqc or [])
 
 
 callbacks += [sqs] * 2
@@ -58,8 +66,8 @@ callbacks += [sqs] * 2
 
 def sq(_left, sqs, _right) -> fsm.NFA:
     nfa = fsm.NFA()
-    for c in sqs:
-        nfa.start.add_transition(c, nfa.end)
+    for frm, to in sqs:
+        nfa.start.add_range_transition(frm, to, nfa.end)
     return nfa
 
 
@@ -159,20 +167,32 @@ class REParser(Parser):
         return super().parse(io.StringIO(re))
 
 
-compiler = None
+_parser: Optional[REParser] = None
+_parser_lock = threading.Lock()
+
+
+def parser() -> REParser:
+    """Returns the REParser shared by the process, built on first use. The
+    parser keeps no state between parses, so it can be used from any
+    thread."""
+    global _parser
+    if _parser is None:
+        with _parser_lock:
+            if _parser is None:
+                _parser = REParser()
+    return _parser
 
 
 def compile(re: str) -> fsm.DFA:
-    """Compile a regular expression into a DFA. The compiled DFA provides
-    match method to match a string:
+    """Compile a regular expression into a minimal DFA. The compiled DFA
+    provides match method to match a string:
     ```
     dfa = re.compile("a*b")
     dfa.match("aaabb") # returns ({"match"}, 4)
     ```
     """
-    global compiler
-    if not compiler:
-        compiler = REParser()
-    nfa = compiler.parse(re)
+    nfa = parser().parse(re)
     nfa.end.token = "match"
-    return fsm.DFA(nfa)
+    dfa = fsm.DFA(nfa)
+    minimal, (minimal.start, ) = dfa.minimize([dfa.start])
+    return minimal
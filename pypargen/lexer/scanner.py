@@ -0,0 +1,241 @@
+# Copyright 2021 Ilango Rajagopal
+# Licensed under GPL-3.0-only
+
+"""Scanners compiled from the DFA of the terminals to Python code.
+
+Every DFA state becomes a function, which first consumes the run of
+characters looping on the state and then picks the next state by testing
+the next character:
+```
+r3 = re.compile('[0-9]*').match
+def s3(text, idx, end):
+    idx = r3(text, idx, end).end()
+    if idx < end:
+        char = text[idx]
+        if char == '.':
+            return 4, idx + 1
+        if char in {'E', 'e'}:
+            return 5, idx + 1
+    return -1, idx
+```
+The functions return the next state and the index after the character moved
+on, or -1 if the scan stops at the index. Runs of a character class are
+matched by re, in C, and set literals in membership tests are constant
+frozensets, so that each test is a single hash lookup.
+"""
+
+from typing import Callable, Iterable, Optional
+import functools
+import io
+import re
+import threading
+
+from pypargen.base.lexer import UnexpectedCharacter
+from pypargen.base.token import Token
+from pypargen.lexer.fsm import DFA
+from pypargen.lexer.lexer import Automaton, Lexer, automaton
+
+StateFunction = Callable[[str, int, int], tuple[int, int]]
+# Functions of the states, start state and terminals of accepting states
+Start = tuple[list[StateFunction], int, dict[int, str]]
+
+
+def _merge(ranges: Iterable[tuple[int, int]]) -> list[tuple[int, int]]:
+    """Sort the ranges of code points, merging the adjacent ones"""
+    merged = []
+    for first, last in sorted(ranges):
+        if merged and merged[-1][1] + 1 == first:
+            merged[-1] = (merged[-1][0], last)
+        else:
+            merged.append((first, last))
+    return merged
+
+
+def _count(ranges: list[tuple[int, int]]) -> int:
+    """Returns the number of characters in the ranges"""
+    return sum(last - first + 1 for first, last in ranges)
+
+
+def _test(ranges: list[tuple[int, int]]) -> str:
+    """Returns the expression testing if char is in the ranges: a constant
+    set if there are a few characters, comparisons otherwise"""
+    if (count := _count(ranges)) == 1:
+        return f"char == {chr(ranges[0][0])!r}"
+    if count <= 16:
+        chars = (chr(code) for first, last in ranges
+                 for code in range(first, last + 1))
+        return f"char in {{{', '.join(map(repr, chars))}}}"
+    return ' or '.join(f"{chr(first)!r} <= char <= {chr(last)!r}"
+                       if first != last else f"char == {chr(first)!r}"
+                       for first, last in ranges)
+
+
+class Scanner:
+    """Scanner holds the functions compiled for the DFA of an automaton. It
+    is shared by all the ScannerLexers with the same terminals.
+
+    For each set of active terminals, the DFA reachable from its start state
+    is minimized (see DFA.minimize) and compiled when the set is first
+    used."""
+
+    def __init__(self, automaton: Automaton):
+        """Initialize the scanner for the automaton"""
+        self.automaton = automaton
+        self.sources: list[str] = []
+        self._starts: dict[tuple[str, ...], Start] = {}
+        self._lock = threading.Lock()
+
+    def start(self, terminals: list[str]) -> Start:
+        """Returns the functions of the states, the start state and the
+        terminal matched in each accepting state for the active terminals.
+        Raises UnregisteredTerminal as Automaton.start."""
+        if (start := self._starts.get(key := tuple(terminals))) is not None:
+            return start
+
+        state = self.automaton.start(terminals)
+        with self._lock:
+            if (start := self._starts.get(key)) is not None:
+                return start
+            dfa, (state, ) = self.automaton.dfa.minimize([state])
+
+            accepts = {}
+            for x, tokens in enumerate(dfa.tokens):
+                for term in terminals:
+                    if tokens and term in tokens:
+                        accepts[x] = term
+                        break
+            start = self._starts[key] = (self.compile(dfa), state, accepts)
+        return start
+
+    @staticmethod
+    def source(dfa: DFA, state: int) -> str:
+        """Returns the source of the function for the state of the explicit
+        DFA"""
+        classes = {}
+        for cls, nxt in sorted(dfa.table[state].items()):
+            if nxt >= 0:
+                classes.setdefault(nxt, []).append(cls)
+        targets = {
+            nxt: _merge(r for cls in group for r in dfa.alphabet.ranges(cls))
+            for nxt, group in classes.items()
+        }
+
+        src = []
+        loop = targets.pop(state, None)
+        if loop and _count(loop) > 1:
+            # Runs of a character class are matched by re, in C
+            chars = ''.join(
+                re.escape(chr(first)) if first == last else
+                f"{re.escape(chr(first))}-{re.escape(chr(last))}"
+                for first, last in loop)
+            src.append(f"r{state} = re.compile({f'[{chars}]*'!r}).match")
+        src.append(f"def s{state}(text, idx, end):")
+        if loop and _count(loop) == 1:
+            char = chr(loop[0][0])
+            src.append(f"    while idx < end and text[idx] == {char!r}:")
+            src.append("        idx += 1")
+        elif loop:
+            src.append(f"    idx = r{state}(text, idx, end).end()")
+        if targets:
+            src.append("    if idx < end:")
+            src.append("        char = text[idx]")
+            # Most likely targets first
+            for nxt in sorted(targets, key=lambda x: -_count(targets[x])):
+                src.append(f"        if {_test(targets[nxt])}:")
+                src.append(f"            return {nxt}, idx + 1")
+        src.append("    return -1, idx")
+        return '\n'.join(src) + '\n'
+
+    def compile(self, dfa: DFA) -> list[StateFunction]:
+        """Compile the functions of all the states of the explicit DFA"""
+        states = range(len(dfa.nodes))
+        source = '\n\n'.join(self.source(dfa, state) for state in states)
+        namespace = {"re": re}
+        exec(compile(source, "<pypargen scanner>", "exec"), namespace)
+        self.sources.append(source)
+        return [namespace[f"s{state}"] for state in states]
+
+
+@functools.lru_cache(maxsize=256)
+def _scanner(terminals: tuple[str, ...]) -> Scanner:
+    return Scanner(automaton(list(terminals)))
+
+
+def scanner(terminals: list[str]) -> Scanner:
+    """Returns the scanner for the terminals, sharing the automaton with the
+    Lexer. Scanners are evicted like the automata."""
+    return _scanner(tuple(terminals))
+
+
+class ScannerLexer(Lexer):
+    """Lexer scanning with the code compiled from the DFA (see
+    pypargen.lexer.scanner) instead of interpreting the DFA transitions.
+    It matches exactly like Lexer does."""
+
+    def __init__(self,
+                 terminals: list[str],
+                 inpt: io.RawIOBase,
+                 whitespaces: Optional[str] = None,
+                 bufsize: Optional[int] = None):
+        """Initialize the lexer, see help(Lexer)"""
+        super().__init__(terminals, inpt, whitespaces, bufsize)
+        self.spaces = frozenset(self.whitespaces)
+        self.scanner = scanner(self.terminals)
+
+    def nextToken(self, terminals: Optional[list[str]] = None) -> Token:
+        """Request next token from the Lexer. Pass optional terminals to look
+        for only these terminals."""
+        if self.stopped:
+            raise StopIteration
+
+        chunk, begin = self.chunk, self.idx
+        end = len(chunk)
+        spaces = self.spaces
+        while begin < end and chunk[begin] in spaces:
+            begin += 1
+        if begin == end:
+            self.idx = begin
+            if not self.skip():
+                self.stopped = True
+                return Token('$', None)
+            chunk, begin = self.chunk, self.idx
+            end = len(chunk)
+
+        if terminals is None:
+            terminals = self.terminals
+        functions, state, accepts = self.scanner.start(terminals)
+        if state < 0:
+            self.idx = begin
+            raise UnexpectedCharacter(self.buf, self.pos, terminals)
+
+        nxt = functions[state](chunk, begin, end)
+        while nxt[0] >= 0:
+            state = nxt[0]
+            nxt = functions[state](chunk, nxt[1], end)
+        idx = nxt[1]
+
+        if idx < end:
+            content = chunk[begin:idx]
+        else:
+            # Token continues in the next chunks
+            content = chunk[begin:]
+            while self.fill():
+                chunk, end = self.chunk, len(self.chunk)
+                nxt = functions[state](chunk, 0, end)
+                while nxt[0] >= 0:
+                    state = nxt[0]
+                    nxt = functions[state](chunk, nxt[1], end)
+                idx = nxt[1]
+                content += chunk[:idx]
+                if idx < end:
+                    break
+            else:
+                idx = 0
+        self.idx = idx
+
+        if (term := accepts.get(state)) is None:
+            raise UnexpectedCharacter(self.buf, self.pos, terminals)
+        return Token(term, content)
+
+
+__all__ = ["ScannerLexer"]
@@ -5,3 +5,6 @@
 
 from pypargen.lr1.grammar import *
 from pypargen.lr1.parser import *
+from pypargen.lr1.cache import *
+from pypargen.lr1.table import *
+from pypargen.lr1.codegen import *
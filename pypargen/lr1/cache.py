@@ -0,0 +1,157 @@
+# Copyright 2021 Ilango Rajagopal
+# Licensed under GPL-3.0-only
+
+"""Serialization and on-disk caching of parse tables.
+
+Generating the LR(1) parse table is by far the most expensive part of building
+a parser. A table artifact is a JSON document holding the format version, a
+key derived from the grammar contents and the table itself. The TableCache
+stores such artifacts in a directory, so that parsers for a grammar that was
+already seen can skip the table generation completely.
+"""
+
+from typing import Optional, TextIO, Union
+import hashlib
+import json
+import os
+import pathlib
+import threading
+
+from pypargen.base.grammar import BaseGrammar
+
+# Bump this whenever the table layout or the table generation changes
+TABLE_VERSION = 2
+
+Table = list[dict[str, Union[int, str]]]
+
+
+class StaleTable(Exception):
+    """Exception thrown when a table artifact does not belong to the grammar
+    or was written with a different format version."""
+
+
+def grammar_key(grammar: BaseGrammar) -> str:
+    """Returns the content hash of the grammar. It covers the rules (with
+    their order), the start symbol, the grammar class and its table
+    construction mode."""
+    content = json.dumps([
+        TABLE_VERSION,
+        type(grammar).__name__,
+        getattr(grammar, "mode", None),
+        grammar.start,
+        [[lhs, list(rhs)] for lhs, rhs in grammar],
+    ])
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def dump_table(grammar: BaseGrammar, table: Table, fp: TextIO):
+    """Write the parse table of grammar as an artifact to fp"""
+    json.dump(
+        {
+            "version": TABLE_VERSION,
+            "key": grammar_key(grammar),
+            "start": grammar.start,
+            "table": table,
+        },
+        fp,
+        ensure_ascii=False,
+        separators=(',', ':'))
+
+
+def load_table(grammar: BaseGrammar, fp: TextIO) -> Table:
+    """Read the parse table of grammar from the artifact in fp. Raises
+    StaleTable if the artifact is not valid for the grammar."""
+    try:
+        artifact = json.load(fp)
+    except ValueError as err:
+        raise StaleTable(f"Invalid table artifact: {err}") from err
+
+    if not isinstance(artifact, dict):
+        raise StaleTable("Invalid table artifact")
+    if artifact.get("version") != TABLE_VERSION:
+        raise StaleTable(f"Table version {artifact.get('version')} does not "
+                         f"match {TABLE_VERSION}")
+    if artifact.get("key") != grammar_key(grammar):
+        raise StaleTable("Table was generated for a different grammar")
+    return artifact["table"]
+
+
+def default_directory() -> Optional[pathlib.Path]:
+    """Returns the default cache directory.
+
+    PYPARGEN_CACHE_DIR environment variable overrides the directory, setting
+    it to an empty string disables the cache. Otherwise pypargen directory
+    inside XDG_CACHE_HOME (or ~/.cache) is used."""
+    if (directory := os.environ.get("PYPARGEN_CACHE_DIR")) is not None:
+        return pathlib.Path(directory) if directory else None
+    if xdg := os.environ.get("XDG_CACHE_HOME"):
+        return pathlib.Path(xdg) / "pypargen"
+    return pathlib.Path.home() / ".cache" / "pypargen"
+
+
+class TableCache:
+    """TableCache stores parse tables in a directory, one file per grammar.
+    ```
+    cache = TableCache("/tmp/tables")
+    table = cache.parse_table(grammar)  # Generated and stored
+    table = cache.parse_table(grammar)  # Loaded from the directory
+    ```
+    """
+
+    def __init__(self, directory: Union[str, os.PathLike]):
+        """Initialize the cache with the directory to store tables in. The
+        directory is created when the first table is stored."""
+        self.directory = pathlib.Path(directory)
+
+    def path(self, grammar: BaseGrammar) -> pathlib.Path:
+        """Returns the path of the artifact for the grammar"""
+        return self.directory / f"{grammar_key(grammar)}.json"
+
+    def get(self, grammar: BaseGrammar) -> Optional[Table]:
+        """Returns the cached table for grammar or None if there is no valid
+        table in the cache"""
+        try:
+            with self.path(grammar).open(encoding="utf-8") as fp:
+                return load_table(grammar, fp)
+        except (OSError, StaleTable):
+            return None
+
+    def put(self, grammar: BaseGrammar, table: Table):
+        """Store the table for grammar. The file is replaced atomically, so
+        concurrent readers never see partial tables. Failing to write the
+        cache (e.g. read-only file system) is not an error."""
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            path = self.path(grammar)
+            # Temporary file private to the writer (process and thread)
+            tmp = path.with_name(
+                f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            try:
+                with open(tmp, 'w', encoding="utf-8") as fp:
+                    dump_table(grammar, table, fp)
+                os.replace(tmp, path)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        except OSError:
+            pass
+
+    def parse_table(self, grammar: BaseGrammar) -> Table:
+        """Returns the parse table for grammar, generating and storing it if
+        it is not cached yet."""
+        if (table := self.get(grammar)) is not None:
+            return table
+        table = grammar.parse_table()
+        self.put(grammar, table)
+        return table
+
+    @classmethod
+    def default(cls) -> Optional["TableCache"]:
+        """Returns the cache for the default directory (see
+        default_directory) or None if caching is disabled."""
+        if (directory := default_directory()) is None:
+            return None
+        return cls(directory)
+
+
+__all__ = ["TableCache"]
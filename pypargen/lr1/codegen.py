@@ -0,0 +1,241 @@
+# Copyright 2021 Ilango Rajagopal
+# Licensed under GPL-3.0-only
+
+"""Ahead of time generation of standalone parser modules.
+
+generate_parser writes the compiled parse table of a grammar, the DFA of its
+terminals and a driver specialized for them as a Python module. The module
+imports the callbacks by reference and nothing else from pypargen, so
+importing it costs only the unmarshalling of a few constants:
+```
+with open("json_parser.py", 'w') as fp:
+    fp.write(generate_parser(json_grammar, callbacks, whitespaces=" \\n"))
+
+import json_parser
+value = json_parser.parse(sys.stdin)
+```
+The terminals are matched like the Lexer does (the regular expressions of
+pypargen.lexer.re, longest match), not like the PyRELexer.
+"""
+
+from typing import Callable, Optional, Union
+import importlib
+import pprint
+
+import pypargen
+from pypargen.lexer import fsm, lexer
+from pypargen.lr1.cache import TableCache
+from pypargen.lr1.grammar import Grammar
+from pypargen.lr1.table import CompiledTable
+
+HEADER = '''\
+# Generated by pypargen {version}. Do not edit.
+
+"""Standalone parser module, see help(parse)"""
+
+from bisect import bisect_right
+'''
+
+DRIVER = '''
+
+def _token(text, pos, lexer):
+    """Returns the terminal id, content and end of the token at pos"""
+    while pos < len(text) and text[pos] in WHITESPACES:
+        pos += 1
+    if pos == len(text):
+        return 0, None, pos
+
+    state, accepts = LEXER_STARTS[lexer], LEXER_ACCEPTS[lexer]
+    idx = pos
+    while idx < len(text):
+        if (code := ord(text[idx])) < 128:
+            cls = CLASS_ASCII[code]
+        else:
+            cls = CLASS_IDS[bisect_right(CLASS_BOUNDS, code) - 1]
+        if (nstate := TRANSITIONS[state].get(cls)) is None:
+            break
+        state = nstate
+        idx += 1
+    if (term := accepts.get(state)) is None:
+        char = text[idx:idx + 1] or text[pos:pos + 1]
+        raise SyntaxError(f"Invalid character {char!r} at position {idx}")
+    return term, text[pos:idx], idx
+
+
+def parse(inpt):
+    """Parse the input, a stream or the string itself (bytes are decoded
+    as UTF-8), and provide the final result from callbacks."""
+    text = inpt
+    if not isinstance(text, (str, bytes, bytearray)):
+        text = inpt.read()
+    if not isinstance(text, str):
+        text = bytes(text).decode()
+    base, check, value = BASE, CHECK, VALUE
+    rule_len, rule_lhs, lexers = RULE_LEN, RULE_LHS, LEXERS
+
+    state = 0
+    states = [0]
+    values = [None]
+
+    sym, content, pos = _token(text, 0, lexers[0])
+    while True:
+        idx = base[state] + sym
+        nxt = value[idx] if check[idx] == state else 0
+
+        if nxt > 0:
+            state = nxt
+            states.append(state)
+            values.append(content)
+            sym, content, pos = _token(text, pos, lexers[state])
+            continue
+
+        if nxt == 0:
+            if sym == 0:
+                raise EOFError("Unexpected EOF")
+            raise SyntaxError("Unexpected token",
+                              ("input", 0, pos, TERMINALS[sym]))
+
+        if nxt == ACCEPT:
+            return values[1]
+
+        rule_num = -nxt - 1
+        if rhs_len := rule_len[rule_num]:
+            lhs_content = CALLBACKS[rule_num](*values[-rhs_len:])
+            del values[-rhs_len:]
+            del states[-rhs_len:]
+        else:
+            lhs_content = CALLBACKS[rule_num]()
+        values.append(lhs_content)
+
+        state = states[-1]
+        state = value[base[state] + rule_lhs[rule_num]]
+        states.append(state)
+
+
+def parse_file(path):
+    """Parse the file at path"""
+    with open(path, encoding="utf-8") as fp:
+        return parse(fp.read())
+'''
+
+
+def callback_reference(callback: Callable) -> tuple[str, str]:
+    """Returns the module and qualified name to import callback by. Raises
+    ValueError if callback cannot be imported by them (e.g. lambdas, nested
+    functions or functions of __main__)."""
+    module = getattr(callback, "__module__", None)
+    qualname = getattr(callback, "__qualname__", None)
+    if not module or not qualname or module == "__main__" or \
+            '<' in qualname:
+        raise ValueError(f"Callback {callback!r} is not importable")
+
+    try:
+        obj = importlib.import_module(module)
+        for name in qualname.split('.'):
+            obj = getattr(obj, name)
+    except (ImportError, AttributeError):
+        obj = None
+    if obj != callback:
+        raise ValueError(f"Callback {callback!r} is not importable as "
+                         f"{module}.{qualname}")
+    return module, qualname
+
+
+def lexer_tables(
+    terminals: list[str], expected: list[list[str]]
+) -> tuple[list[int], list[int], list[dict[int, int]], fsm.Alphabet,
+           list[dict[int, int]]]:
+    """Builds the minimal DFA of terminals for every set of expected
+    terminals.
+
+    Returns the lexer index of each state of the parse table, the start DFA
+    state and the accepting DFA states (with the terminal id, $ being 0) of
+    each lexer, the alphabet and the transitions (by class) of the DFA
+    states."""
+    automaton = lexer.Automaton(terminals)
+    term_ids = {term: i for i, term in enumerate(terminals, 1)}
+
+    lexers = {}
+    lexer_of = []
+    for active in expected:
+        lexer_of.append(lexers.setdefault(tuple(active), len(lexers)))
+
+    # The minimal DFA over the start states of all the lexers
+    dfa, starts = automaton.dfa.minimize(
+        [automaton.start(list(active)) for active in lexers])
+    reachable = {start: dfa.explore([start]) for start in set(starts)}
+    accepts = []
+    for active, start in zip(lexers, starts):
+        accept = {}
+        for state in reachable.get(start, ()):
+            if tokens := dfa.tokens[state]:
+                for term in active:
+                    if term in tokens:
+                        accept[state] = term_ids[term]
+                        break
+        accepts.append(accept)
+
+    # Start state of a lexer is -1 if it matches nothing, the dead state -1
+    # is an extra state without transitions
+    transitions = [dict(sorted(table.items())) for table in dfa.table]
+    transitions.append({})
+    return lexer_of, starts, accepts, dfa.alphabet, transitions
+
+
+def generate_parser(grammar: Grammar,
+                    callbacks: list[Callable],
+                    whitespaces: Optional[str] = None,
+                    cache: Union[TableCache, bool, None] = True) -> str:
+    """Returns the source of a standalone parser module for the grammar.
+
+    callbacks are as for the Parser, but must be importable by their module
+    and qualified name. The parse table is looked up in the cache like the
+    Parser does. See help(pypargen.lr1.codegen) for the usage."""
+    assert len(grammar) == len(callbacks),\
+        "Callbacks and grammar must be of same size"
+    if cache is True:
+        cache = TableCache.default()
+    table = cache.parse_table(grammar) if cache else grammar.parse_table()
+    compiled = CompiledTable(grammar, table)
+    lexer_of, starts, accepts, alphabet, transitions = lexer_tables(
+        grammar.terminals, compiled.expected)
+
+    src = [HEADER.format(version=pypargen.__version__)]
+    names = {}
+    for callback in callbacks:
+        ref = callback_reference(callback)
+        if ref in names:
+            continue
+        module, qualname = ref
+        name = names[ref] = f"_callback{len(names)}"
+        first, _, rest = qualname.partition('.')
+        src.append(f"from {module} import {first} as {name}\n")
+        if rest:
+            src.append(f"{name} = {name}.{rest}\n")
+    src.append('\n')
+
+    def const(name: str, value: any):
+        src.append(f"{name} = {pprint.pformat(value, compact=True)}\n")
+
+    refs = [names[callback_reference(callback)] for callback in callbacks]
+    src.append(f"CALLBACKS = ({', '.join(refs)},)\n")
+    const("TERMINALS", tuple(compiled.terminals))
+    const("ACCEPT", compiled.accept)
+    const("BASE", tuple(compiled.base))
+    const("CHECK", tuple(compiled.check))
+    const("VALUE", tuple(compiled.value))
+    const("RULE_LEN", tuple(compiled.rule_len))
+    const("RULE_LHS", tuple(compiled.rule_lhs))
+    const("WHITESPACES", whitespaces or "")
+    const("LEXERS", tuple(lexer_of))
+    const("LEXER_STARTS", tuple(starts))
+    const("LEXER_ACCEPTS", tuple(accepts))
+    const("CLASS_ASCII", tuple(alphabet.ascii))
+    const("CLASS_BOUNDS", tuple(alphabet.bounds))
+    const("CLASS_IDS", tuple(alphabet.ids))
+    const("TRANSITIONS", tuple(transitions))
+    src.append(DRIVER)
+    return ''.join(src)
+
+
+__all__ = ["generate_parser"]
@@ -1,14 +1,32 @@
 # Copyright 2021 Ilango Rajagopal
 # Licensed under GPL-3.0-only
 
-from typing import Union
+from typing import TYPE_CHECKING, Callable, Iterable, Optional, Union
+import itertools
 
 from pypargen.base.grammar import BaseGrammar
 from pypargen.base.rule import Rule
+from pypargen.lr1.items import Items
+from pypargen.lr1.pool import process_pool
+
+if TYPE_CHECKING:
+    from concurrent.futures import Executor
+
+# Smallest number of states to be expanded together that is worth sharding
+# across the worker processes, fewer states are expanded in this process.
+# Each worker process is given PARALLEL_CHUNK states at a time.
+PARALLEL_MIN_STATES = 64
+PARALLEL_CHUNK = 32
+
+# Items of the grammar whose table is being built, in a worker process
+_worker_items: Optional[Items] = None
 
 
 class Item:
-    """Item is an LR(1) item"""
+    """Item is an LR(1) item. Parse tables are built with compact items (see
+    pypargen.lr1.items), Item is the readable form of them."""
+
+    __slots__ = ("lhs", "rhs", "pos", "lookahead")
 
     def __init__(self, lhs: str, rhs: list[str], pos: int, lookahead: str):
         """Initialize the grammar item"""
@@ -65,32 +83,113 @@ class ReduceReduceConflict(Exception):
         super().__init__(f"Reduce/Reduce Conflict:\n{msg}")
 
 
+def _init_worker(items: Items):
+    """Initialize the worker process with the items of the grammar"""
+    global _worker_items
+    _worker_items = items
+
+
+def _successors(
+    items: Items, closure: Callable[[Iterable[int]], frozenset[int]],
+    kernels: list[frozenset[int]]
+) -> list[tuple[list[int], dict[str, list[int]]]]:
+    """Close each of the kernels and group the advanced items of the closure
+    by the symbol after the dot, giving the kernels of the gotos. Only the
+    items to reduce by (dot at the end) are kept of the closure, so that
+    little is sent back from the worker processes."""
+    shift, nexts = items.shift, items.next
+    advance = 1 << shift
+    successors = []
+    for kernel in kernels:
+        reductions = []
+        gotos = {}
+        for item in closure(kernel):
+            if (sym := nexts[item >> shift]) is not None:
+                gotos.setdefault(sym, []).append(item + advance)
+            else:
+                reductions.append(item)
+        successors.append((reductions, gotos))
+    return successors
+
+
+def _worker_successors(
+    closure: str, kernels: list[frozenset[int]]
+) -> list[tuple[list[int], dict[str, list[int]]]]:
+    """_successors in a worker process, closure being the method name"""
+    return _successors(_worker_items, getattr(_worker_items, closure),
+                       kernels)
+
+
+def _weakly_compatible(kernel1: dict[int, int],
+                       kernel2: dict[int, int]) -> bool:
+    """Pager's weak compatibility of two kernels with the same cores (as
+    lookahead bitsets keyed by core). Merging such kernels cannot give a
+    reduce/reduce conflict that the canonical LR(1) states do not have."""
+    cores = list(kernel1)
+    for i, core1 in enumerate(cores):
+        for core2 in cores[i + 1:]:
+            if not (kernel1[core1] & kernel2[core2]
+                    or kernel2[core1] & kernel1[core2]):
+                continue
+            if not (kernel1[core1] & kernel1[core2]
+                    or kernel2[core1] & kernel2[core2]):
+                return False
+    return True
+
+
 class Grammar(BaseGrammar):
     """Grammar is a LR(1) grammar. The parse_table method gives the parsing
-    table for the grammar."""
+    table for the grammar.
+
+    The mode selects how the parse table is constructed:
+    - "lr1": Canonical LR(1) table
+    - "lalr1": LALR(1) table, which has as many states as the LR(0) automaton
+      and hence is much smaller. The grammar may have reduce/reduce conflicts
+      in this mode even if it is LR(1).
+    - "pager": Minimal LR(1) table by Pager's method. It is as powerful as
+      the canonical LR(1) table, but has (nearly) as many states as LALR(1).
+    All modes give tables of the same form, usable with the Parser."""
+
+    modes = ("lr1", "lalr1", "pager")
+
+    def __init__(self, iterable=(), start=None, mode: str = "lr1"):
+        """Create grammar with iterable of rules, the start symbol and the
+        table construction mode"""
+        super().__init__(iterable, start)
+        self.mode = mode
+
+    @property
+    def mode(self) -> str:
+        """Returns the table construction mode of the grammar"""
+        return self._mode
+
+    @mode.setter
+    def mode(self, mode: str):
+        """Sets the table construction mode. Checks for validity"""
+        assert mode in self.modes, f"Mode must be one of {self.modes}"
+        self._mode = mode
 
     def closure(self, items: list[Item]) -> list[Item]:
         """Closure calculates the closure a for set of items."""
         assert len(items) == len(set(items)), "Items must not be repeated"
 
+        # Items are closed in the order they are added, each only once
         closure_items = {k: None for k in items}
-        new_items = {}
-        while True:
-            for item in closure_items:
-                if item.done:
-                    continue
-                if item.rhs[item.pos].startswith('"'):
-                    continue
-                for lhs, rhs in self:
-                    if item.rhs[item.pos] == lhs:
-                        for lookahead in self.first(item.rhs[item.pos + 1:] +
-                                                    [item.lookahead]):
-                            if lookahead != 'ϵ':
-                                new_items[Item(lhs, rhs, 0, lookahead)] = None
-            if set(closure_items).issuperset(new_items):
-                break
-            closure_items |= new_items
-            new_items = {}
+        queue = list(items)
+        for item in queue:
+            if item.done or item.rhs[item.pos].startswith('"'):
+                continue
+            lookaheads = self.first(item.rhs[item.pos + 1:] +
+                                    [item.lookahead])
+            for num in self.rules_by_lhs.get(item.rhs[item.pos], ()):
+                lhs, rhs = self[num]
+                for lookahead in lookaheads:
+                    if lookahead == 'ϵ':
+                        continue
+                    if (new := Item(lhs, rhs, 0, lookahead)) in closure_items:
+                        continue
+                    closure_items[new] = None
+                    queue.append(new)
         return list(closure_items)
 
     def goto(self, items: list[Item], token: str) -> list[Item]:
@@ -108,52 +207,259 @@ class Grammar(BaseGrammar):
                 goto[gitem] = None
         return self.closure(goto)
 
-    def parse_table(self) -> list[dict[str, Union[int, str]]]:
-        """parse_table gives the parsing table for the grammar."""
-        init_item = Item("__root__", [self.start], 0, '$')
-        set_of_items = [self.closure([init_item])]
+    def _automaton(
+        self,
+        items: Items,
+        init_item: int,
+        closure: Callable[[Iterable[int]], frozenset[int]],
+        executor: Optional["Executor"] = None
+    ) -> tuple[list[frozenset[int]], list[list[int]], list[dict[str, int]]]:
+        """Builds the sets of items reachable from init_item along with their
+        goto table. closure decides the kind of items (LR(0) or LR(1)).
+
+        States are identified by their kernel items alone, so the closure of
+        a goto is taken only once, when its kernel is first seen. Returns the
+        kernels, the items to reduce by of each state and the goto table.
+
+        The states are expanded a frontier at a time: all the states found
+        while expanding the previous frontier. Given an executor (of worker
+        processes initialized with _init_worker), big frontiers are sharded
+        across it. The results are merged in the order of states, so the
+        numbering is same as that of expanding them one by one."""
+        kernels = [frozenset([init_item])]
+        states = {kernels[0]: 0}
+        reductions = []
 
         table = [{}]
-        symbols = self.terminals
-        symbols.extend(self.nonterminals)
-
-        # Dragon book: 4.7.1 Canonical LR(1) Parser
-        # Build goto table
-        while True:
-            added = False
-            for idx, items in enumerate(set_of_items):
-                for sym in symbols:
-                    if gitems := self.goto(items, sym):
-                        if gitems not in set_of_items:
-                            set_of_items.append(gitems)
-                            table.append({})
-                            added = True
-                        table[idx][sym] = set_of_items.index(gitems)
-                if added:
-                    break
-            if not added:
-                break
-
-        # Fill the reduction entries
-        for idx, items in enumerate(set_of_items):
-            for item in items:
-                if item.done:
-
-                    # If conflict, raise proper error
-                    if conflict := table[idx].get(item.lookahead, None):
-                        if isinstance(conflict, int):
-                            raise ShiftReduceConflict(self, items,
-                                                      item.lookahead)
-
-                        rule1 = self[int(conflict[1:])]
-                        rule2 = Rule(item.lhs, item.rhs)
-                        raise ReduceReduceConflict(rule1, rule2)
-
-                    if item.lhs == "__root__":
-                        table[idx][item.lookahead] = 'c'
+        symbols = self.terminals + self.nonterminals
+        order = {sym: i for i, sym in enumerate(symbols)}
+
+        # States not closed yet form the worklist at the end of kernels, so
+        # the states are numbered in the order they are found
+        idx = 0
+        while idx < len(kernels):
+            frontier = kernels[idx:]
+            if executor is None or len(frontier) < PARALLEL_MIN_STATES:
+                successors = _successors(items, closure, frontier)
+            else:
+                chunks = [
+                    frontier[i:i + PARALLEL_CHUNK]
+                    for i in range(0, len(frontier), PARALLEL_CHUNK)
+                ]
+                successors = itertools.chain.from_iterable(
+                    executor.map(_worker_successors,
+                                 itertools.repeat(closure.__name__), chunks))
+
+            for done, gotos in successors:
+                reductions.append(done)
+                for sym in sorted(gotos, key=order.__getitem__):
+                    kernel = frozenset(gotos[sym])
+                    if (nxt := states.get(kernel)) is None:
+                        nxt = states[kernel] = len(kernels)
+                        kernels.append(kernel)
+                        table.append({})
+                    table[idx][sym] = nxt
+                idx += 1
+
+        return kernels, reductions, table
+
+    def _lalr1_items(
+        self,
+        items: Items,
+        executor: Optional["Executor"] = None
+    ) -> tuple[list[list[int]], list[dict[str, int]]]:
+        """Builds the LALR(1) kernels (with their lookaheads) and the goto
+        table.
+
+        Dragon book: 4.7.5 Efficient Construction of LALR Parsing Tables
+        The states are the LR(0) sets of items. Lookaheads of the kernel items
+        are either generated spontaneously or propagated from the kernel
+        items of the preceding state, which is found by taking closure of each
+        kernel item with a dummy lookahead (#)."""
+        shift, mask, nexts = items.shift, items.mask, items.next
+        root = items.offsets[items.root]
+        kernels, _, table = self._automaton(items, items.item(root),
+                                            items.closure0, executor)
+        kernels = [[item >> shift for item in kernel] for kernel in kernels]
+
+        # Lookaheads of the kernel items as bitsets, keyed by (state, core)
+        lookaheads = {(0, root): 1 << items.lookaheads.index('$')}
+        propagates = {}
+        for idx, kernel in enumerate(kernels):
+            for core in kernel:
+                lookaheads.setdefault((idx, core), 0)
+                targets = propagates.setdefault((idx, core), [])
+                for item in items.closure([items.item(core, items.dummy)]):
+                    if (sym := nexts[item >> shift]) is None:
                         continue
-                    table[idx][item.lookahead] = \
-                        f"r{self.index((item.lhs, item.rhs))}"
+                    target = (table[idx][sym], (item >> shift) + 1)
+                    if (lookahead := item & mask) == items.dummy:
+                        targets.append(target)
+                    else:
+                        lookaheads[target] = \
+                            lookaheads.get(target, 0) | 1 << lookahead
+
+        # Propagate the lookaheads till nothing changes
+        stack = list(lookaheads)
+        while stack:
+            source = stack.pop()
+            for target in propagates.get(source, ()):
+                new = lookaheads[target] | lookaheads[source]
+                if new != lookaheads[target]:
+                    lookaheads[target] = new
+                    stack.append(target)
+
+        lr1_kernels = []
+        for idx, kernel in enumerate(kernels):
+            kitems = []
+            for core in kernel:
+                bits = lookaheads[(idx, core)]
+                kitems.extend(
+                    items.item(core, la) for la in range(bits.bit_length())
+                    if bits >> la & 1)
+            lr1_kernels.append(kitems)
+        return lr1_kernels, table
+
+    def _pager_items(
+        self, items: Items
+    ) -> tuple[list[list[int]], list[dict[str, int]]]:
+        """Builds the minimal LR(1) kernels and the goto table.
+
+        Pager's practical general method (with weak compatibility): the
+        canonical LR(1) states are built, but a new state is merged into an
+        existing state with the same cores if the two are weakly compatible.
+        When merging grows the lookaheads of a state, its gotos are computed
+        again to propagate them. States left unreachable by that are dropped
+        at the end and the rest numbered in the order they are reached."""
+        shift, mask, nexts = items.shift, items.mask, items.next
+        root = items.offsets[items.root]
+        order = {
+            sym: i
+            for i, sym in enumerate(self.terminals + self.nonterminals)
+        }
+
+        def expand(kernel: dict[int, int]) -> list[int]:
+            return [
+                items.item(core, la) for core, bits in kernel.items()
+                for la in range(bits.bit_length()) if bits >> la & 1
+            ]
+
+        # Kernels as lookahead bitsets keyed by core, and the states with
+        # the same cores
+        kernels = [{root: 1 << items.lookaheads.index('$')}]
+        by_cores = {frozenset([root]): [0]}
+        table = [{}]
+        stack, queued = [0], {0}
+        while stack:
+            queued.discard(idx := stack.pop())
+
+            gotos = {}
+            for item in items.closure(expand(kernels[idx])):
+                if (sym := nexts[core := item >> shift]) is not None:
+                    kernel = gotos.setdefault(sym, {})
+                    kernel[core + 1] = kernel.get(core + 1, 0) | \
+                        1 << (item & mask)
+
+            prev, table[idx] = table[idx], {}
+            for sym in sorted(gotos, key=order.__getitem__):
+                kernel = gotos[sym]
+                states = by_cores.setdefault(frozenset(kernel), [])
+                # Prefer the state gone to before, whose lookaheads already
+                # include the ones from here
+                if (nxt := prev.get(sym)) not in states or \
+                        not _weakly_compatible(kernels[nxt], kernel):
+                    for nxt in states:
+                        if _weakly_compatible(kernels[nxt], kernel):
+                            break
+                    else:
+                        nxt = len(kernels)
+                        kernels.append(dict.fromkeys(kernel, 0))
+                        table.append({})
+                        states.append(nxt)
+
+                merged = kernels[nxt]
+                if any(bits & ~merged[core] for core, bits in kernel.items()):
+                    for core, bits in kernel.items():
+                        merged[core] |= bits
+                    if nxt not in queued:
+                        queued.add(nxt)
+                        stack.append(nxt)
+                table[idx][sym] = nxt
+
+        # Number the reachable states in breadth first order
+        numbers = {0: 0}
+        reached = [0]
+        for idx in reached:
+            for nxt in table[idx].values():
+                if nxt not in numbers:
+                    numbers[nxt] = len(reached)
+                    reached.append(nxt)
+
+        table = [{sym: numbers[nxt]
+                  for sym, nxt in table[idx].items()}
+                 for idx in reached]
+        return [expand(kernels[idx]) for idx in reached], table
+
+    def parse_table(
+            self,
+            workers: Optional[int] = None) -> list[dict[str, Union[int, str]]]:
+        """parse_table gives the parsing table for the grammar, constructed
+        as per the mode of the grammar.
+
+        If workers is more than 1, the states of big grammars are built by as
+        many worker processes (except in pager mode). The table is the same
+        either way."""
+        items = Items(self)
+        if workers is not None and workers > 1 and self.mode != "pager":
+            with process_pool(workers, _init_worker, (items, )) as executor:
+                return self._parse_table(items, executor)
+        return self._parse_table(items)
+
+    def _parse_table(
+        self,
+        items: Items,
+        executor: Optional["Executor"] = None
+    ) -> list[dict[str, Union[int, str]]]:
+        """Builds the parse table from the items, see parse_table"""
+        if self.mode in ("lalr1", "pager"):
+            if self.mode == "lalr1":
+                kernels, table = self._lalr1_items(items, executor)
+            else:
+                kernels, table = self._pager_items(items)
+            reductions = [[
+                item for item in items.closure(kernel) if items.done(item)
+            ] for kernel in kernels]
+        else:
+            # Dragon book: 4.7.1 Canonical LR(1) Parser
+            init_item = items.item(items.offsets[items.root],
+                                   items.lookaheads.index('$'))
+            kernels, reductions, table = self._automaton(
+                items, init_item, items.closure, executor)
+
+        # Fill the reduction entries, in the order of lookaheads
+        shift, mask = items.shift, items.mask
+        for idx, done in enumerate(reductions):
+            for item in sorted(done, key=lambda item: (item & mask, item)):
+                lookahead = items.lookaheads[item & mask]
+                rule_num = items.rule[item >> shift]
+
+                # If conflict, raise proper error
+                if conflict := table[idx].get(lookahead, None):
+                    if isinstance(conflict, int):
+                        state = items.closure(kernels[idx])
+                        raise ShiftReduceConflict(
+                            self, [Item(*items.decode(x)) for x in state],
+                            lookahead)
+
+                    # Accept is the reduction by the augmented root rule
+                    num = items.root if conflict == 'c' else int(conflict[1:])
+                    raise ReduceReduceConflict(items.rules[num],
+                                               items.rules[rule_num])
+
+                if rule_num == items.root:
+                    table[idx][lookahead] = 'c'
+                    continue
+                table[idx][lookahead] = f"r{rule_num}"
 
         return table
 
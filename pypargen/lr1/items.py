@@ -0,0 +1,158 @@
+# Copyright 2021 Ilango Rajagopal
+# Licensed under GPL-3.0-only
+
+"""Compact, interned LR items used for building the parse tables.
+
+Every (rule, dot position) pair of the augmented grammar is an LR(0) item,
+called core here, numbered consecutively rule after rule, so that moving the
+dot is adding one. An LR(1) item is a single int: core << shift | lookahead,
+the lookahead being the id of terminal in the grammar analysis (terminals in
+order, then $). Sets of items are frozensets of these ints, which are cheap
+to hash and compare.
+"""
+
+from typing import Iterable, Optional
+
+from pypargen.base.grammar import BaseGrammar
+from pypargen.base.rule import Rule
+
+
+class Items:
+    """Items interns the LR items of a grammar"""
+
+    def __init__(self, grammar: BaseGrammar):
+        """Intern the cores of grammar, augmented with __root__ -> start"""
+        analysis = grammar._analyze()
+        self.grammar = grammar
+        self.rules = list(grammar) + [Rule("__root__", [grammar.start])]
+        self.root = len(grammar)
+
+        # Lookahead ids: terminals, $ and the dummy lookahead # used for
+        # finding propagation of lookaheads
+        self.lookaheads = analysis["symbols"][:len(grammar.terminals) + 1]
+        self.lookaheads.append('#')
+        self.dummy = len(self.lookaheads) - 1
+        self.shift = len(self.lookaheads).bit_length()
+        self.mask = (1 << self.shift) - 1
+
+        # Rules of each nonterminal, duplicate rules merged to the first one
+        rules_of = {
+            lhs: [num for num in nums if grammar.rule_number(*grammar[num])
+                  == num]
+            for lhs, nums in grammar.rules_by_lhs.items()
+        }
+
+        nullable, firsts = analysis["nullable"], analysis["firsts"]
+        self.offsets = []
+        self.rule = []  # Rule number of core
+        self.pos = []  # Dot position of core
+        self.next: list[Optional[str]] = []  # Symbol after dot
+        self.first = []  # FIRST of the symbols after next, as bitset
+        self.nullable = []  # True if all the symbols after next are nullable
+        for num, (_, rhs) in enumerate(self.rules):
+            self.offsets.append(len(self.rule))
+            for pos in range(len(rhs) + 1):
+                self.rule.append(num)
+                self.pos.append(pos)
+                self.next.append(rhs[pos] if pos < len(rhs) else None)
+
+                first, rest_nullable = 0, True
+                for tok in rhs[pos + 1:]:
+                    if tok not in nullable:
+                        first |= 1 << grammar._symbol_id(tok)
+                        rest_nullable = False
+                        break
+                    first |= firsts[tok]
+                    if not nullable[tok]:
+                        rest_nullable = False
+                        break
+                self.first.append(first)
+                self.nullable.append(rest_nullable)
+
+        # Nonterminals after the dot, as ids, and for each nonterminal the
+        # cores of its rules and the nonterminals at the start of them
+        nt_ids = {lhs: i for i, lhs in enumerate(rules_of)}
+        self.next_nt = [nt_ids.get(sym, -1) for sym in self.next]
+        self.starts = [[self.offsets[num] for num in nums]
+                       for nums in rules_of.values()]
+        self.edges = [[(self.next_nt[core], self.first[core],
+                        self.nullable[core]) for core in cores
+                       if self.next_nt[core] >= 0] for cores in self.starts]
+
+    def item(self, core: int, lookahead: int = 0) -> int:
+        """Returns the LR(1) item for core and lookahead id"""
+        return core << self.shift | lookahead
+
+    def done(self, item: int) -> bool:
+        """True if the dot of the item is at the end"""
+        return self.next[item >> self.shift] is None
+
+    def _lookaheads(self, kernel: Iterable[int]) -> dict[int, int]:
+        """Returns the lookaheads (bitset) of every nonterminal to be closed
+        over for the kernel. Lookaheads flow from the kernel items to the
+        nonterminals after their dots, and from each nonterminal to the
+        nonterminals starting its rules, till nothing changes."""
+        shift, mask = self.shift, self.mask
+        next_nt, firsts, nullable = self.next_nt, self.first, self.nullable
+        edges = self.edges
+
+        lookaheads = {}
+        stack = []
+        for item in kernel:
+            core = item >> shift
+            if (nt := next_nt[core]) < 0:
+                continue
+            bits = firsts[core]
+            if nullable[core]:
+                bits |= 1 << (item & mask)
+            if (old := lookaheads.get(nt, 0)) | bits != old:
+                lookaheads[nt] = old | bits
+                stack.append(nt)
+
+        while stack:
+            bits = lookaheads[src := stack.pop()]
+            for nt, first, empty in edges[src]:
+                if empty:
+                    first |= bits
+                if (old := lookaheads.get(nt, 0)) | first != old:
+                    lookaheads[nt] = old | first
+                    stack.append(nt)
+        return lookaheads
+
+    def closure(self, kernel: Iterable[int]) -> frozenset[int]:
+        """Closure of the LR(1) items. Every rule of a nonterminal is added
+        once with all the lookaheads found for the nonterminal."""
+        shift, starts = self.shift, self.starts
+        items = set(kernel)
+        for nt, bits in self._lookaheads(items).items():
+            lookaheads = []
+            while bits:
+                low = bits & -bits
+                bits ^= low
+                lookaheads.append(low.bit_length() - 1)
+            for core in starts[nt]:
+                core <<= shift
+                items.update(core | lookahead for lookahead in lookaheads)
+        return frozenset(items)
+
+    def closure0(self, kernel: Iterable[int]) -> frozenset[int]:
+        """Closure of the LR(0) items, i.e. items with lookahead 0"""
+        shift, next_nt, starts, edges = (self.shift, self.next_nt,
+                                         self.starts, self.edges)
+        items = set(kernel)
+        stack = [nt for item in items if (nt := next_nt[item >> shift]) >= 0]
+        seen = set(stack)
+        while stack:
+            for nt, _, _ in edges[stack.pop()]:
+                if nt not in seen:
+                    seen.add(nt)
+                    stack.append(nt)
+        for nt in seen:
+            items.update(core << shift for core in starts[nt])
+        return frozenset(items)
+
+    def decode(self, item: int) -> tuple[str, list[str], int, str]:
+        """Returns the lhs, rhs, dot position and lookahead of the item"""
+        core = item >> self.shift
+        lhs, rhs = self.rules[self.rule[core]]
+        return lhs, rhs, self.pos[core], self.lookaheads[item & self.mask]
@@ -1,14 +1,64 @@
 # Copyright 2021 Ilango Rajagopal
 # Licensed under GPL-3.0-only
 
+from collections import deque
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, Optional,\
+        Union
 import io
-from typing import Callable, Optional
+import itertools
+import mmap
+import os
 
 from pypargen.base.lexer import BaseLexer
-from pypargen.lexer.pyre import PyRELexer
+from pypargen.lexer import lexer as pgen_lexer
+from pypargen.lexer.pyre import PyRELexer, PushPyRELexer, MMapLexer
 from pypargen.base.parser import BaseParser
-from pypargen.base.token import Token
 from pypargen.lr1.grammar import Grammar
+from pypargen.lr1.cache import TableCache
+from pypargen.lr1.codegen import callback_reference
+from pypargen.lr1.pool import process_pool
+from pypargen.lr1.table import CompiledTable
+
+if TYPE_CHECKING:
+    import asyncio
+    from concurrent.futures import Future
+
+# Input of parse_many: a stream, a path or the contents
+Input = Union[io.RawIOBase, os.PathLike, str, bytes]
+
+# Result of Parser._run when more input is needed
+_PENDING = object()
+
+# Session of the worker processes of parse_many
+_worker_session: Optional["Session"] = None
+
+
+def _init_worker(parser: "Parser"):
+    """Initialize a worker process of parse_many with the parser, setting up
+    its lexer once"""
+    global _worker_session
+    _worker_session = parser.session()
+    _worker_session.prepare()
+
+
+def _worker_parse(inputs: list[Input]) -> list[tuple[bool, any]]:
+    """Parse a chunk of inputs in a worker process. Returns for each input
+    whether it was parsed, with the result or the error parsing it."""
+    results = []
+    for inpt in inputs:
+        try:
+            results.append((True, _worker_session.parse(inpt)))
+        except Exception as e:
+            results.append((False, e))
+    return results
+
+
+def _unpack(results: list[tuple[bool, any]]) -> Iterator[any]:
+    """Yield the results of _worker_parse, raising the errors in place"""
+    for parsed, result in results:
+        if not parsed:
+            raise result
+        yield result
 
 
 class Parser(BaseParser):
@@ -18,7 +68,8 @@ class Parser(BaseParser):
                  grammar: Grammar,
                  callbacks: list[Callable],
                  lexerClass: type[BaseLexer] = PyRELexer,
-                 whitespaces: Optional[str] = None):
+                 whitespaces: Optional[str] = None,
+                 cache: Union[TableCache, bool, None] = True):
         """Initialize parser with LR(1) grammar, callbacks and input stream
 
         callbacks is a list of functions that corresponding to the rules.
@@ -41,60 +92,346 @@ class Parser(BaseParser):
 
         Note that the callbacks should take the same number of arguments as RHS
         and return a single value that will be used for next callback.
-        It could be a parse (sub)tree, calculated expression etc."""
+        It could be a parse (sub)tree, calculated expression etc.
+
+        The parse table is looked up in the cache first and stored there once
+        generated. By default (cache=True), the cache at the default directory
+        is used (see TableCache.default). Pass a TableCache to use another
+        directory or False to always generate the table."""
         assert len(grammar) == len(callbacks),\
             "Callbacks and grammar must be of same size"
         super().__init__(grammar, lexerClass, whitespaces)
-        self.table = grammar.parse_table()
+        if cache is True:
+            cache = TableCache.default()
+        if cache:
+            self.table = cache.parse_table(grammar)
+        else:
+            self.table = grammar.parse_table()
+        self.compiled = CompiledTable(grammar, self.table)
         self.callbacks = callbacks
 
     def parse(self, inpt: io.RawIOBase) -> any:
         """Start parsing the input stream and provide the final result from\
         callbacks."""
         lexer = self.lexerClass(self.grammar.terminals, inpt, self.whitespaces)
-        states = [0]
-        tokens = [None]
+        return self.parse_tokens(lexer)
+
+    def parse_file(self,
+                   path: Union[str, os.PathLike],
+                   decode: bool = True) -> any:
+        """Parse the file at path, memory mapping it instead of reading it.
+
+        With a PyRELexer (or its subclass) as the lexer class, the terminals
+        are matched directly over the mapping by MMapLexer and token contents
+        are decoded only for the matched spans. If decode is False, callbacks
+        get memoryview slices of the mapping instead of str; the mapping is
+        then left open till the last view is garbage collected. Other lexers
+        read the mapping as a binary stream and do not support decode=False
+        (ValueError is raised).
+
+        Otherwise the mapping is closed before returning."""
+        if not decode and not issubclass(self.lexerClass, PyRELexer):
+            raise ValueError("decode=False needs a PyRELexer lexer class")
+        with open(path, 'rb') as fp:
+            if os.fstat(fp.fileno()).st_size == 0:
+                mapping = b''
+            else:
+                mapping = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            terminals = self.grammar.terminals
+            if issubclass(self.lexerClass, PyRELexer):
+                lexer = MMapLexer(terminals, mapping, self.whitespaces, decode)
+            else:
+                if not isinstance(mapping, mmap.mmap):
+                    mapping = io.BytesIO(mapping)
+                lexer = self.lexerClass(terminals, mapping, self.whitespaces)
+            return self.parse_tokens(lexer)
+        finally:
+            lexer = None
+            if isinstance(mapping, mmap.mmap):
+                try:
+                    mapping.close()
+                except BufferError:
+                    # Views are still in use, the mapping is closed when it is
+                    # garbage collected after them
+                    pass
+
+    def session(self) -> "Session":
+        """Returns a session to parse many inputs one after another, see
+        help(Session)"""
+        return Session(self)
+
+    def incremental(self) -> "IncrementalParser":
+        """Returns a parser to push the input to in chunks, see
+        help(IncrementalParser)"""
+        return IncrementalParser(self)
+
+    async def parse_async(self,
+                          reader: "asyncio.StreamReader",
+                          bufsize: Optional[int] = None) -> any:
+        """Parse the input of the reader (an asyncio.StreamReader or any
+        object with an async read(n) method) and provide the final result
+        from callbacks. Chunks of bufsize are awaited and fed to an
+        incremental parser (see help(IncrementalParser)), so the other tasks
+        run while the input arrives."""
+        if bufsize is None:
+            bufsize = pgen_lexer.Lexer.bufsize
+        incremental = self.incremental()
+        while data := await reader.read(bufsize):
+            incremental.feed(data)
+        return incremental.close()
+
+    def parse_many(self,
+                   inputs: Iterable[Input],
+                   workers: Optional[int] = None,
+                   chunksize: int = 1,
+                   ordered: bool = True,
+                   prefetch: int = 2) -> Iterator[any]:
+        """Parse the inputs, yielding the result of each. Inputs are streams,
+        paths (os.PathLike, parsed as by parse_file) or the str/bytes
+        contents. The lexer and the stacks are set up once for all of them.
+
+        If workers is more than 1, the inputs are parsed by as many worker
+        processes. Each worker gets the parser once, when it starts, and
+        parses chunks of chunksize inputs. At most prefetch chunks per
+        worker are sent ahead of the results consumed, so inputs are read
+        from the iterable only as the results are. If not ordered, (index,
+        result) pairs are yielded as the chunks complete, instead of the
+        results in the order of inputs.
+
+        The parser is sent to the workers by pickling, so the callbacks must
+        be importable by their module and qualified name: lambdas, nested
+        functions and functions of __main__ are not (ValueError is raised
+        for them). So must be the inputs: stream objects like io.StringIO
+        are, open files are not, pass their paths instead. An error parsing
+        an input is raised when its result is reached."""
+        if workers is None or workers <= 1:
+            return self._parse_many(inputs, ordered)
+        assert chunksize > 0 and prefetch > 0,\
+            "Chunk size and prefetch must be positive"
+        for callback in self.callbacks:
+            callback_reference(callback)
+        return self._parse_pool(inputs, workers, chunksize, ordered,
+                                prefetch)
+
+    def _parse_many(self, inputs: Iterable[Input],
+                    ordered: bool) -> Iterator[any]:
+        """Parse the inputs in this process, see parse_many"""
+        session = self.session()
+        for idx, inpt in enumerate(inputs):
+            yield session.parse(inpt) if ordered else \
+                (idx, session.parse(inpt))
+
+    def _parse_pool(self, inputs: Iterable[Input], workers: int,
+                    chunksize: int, ordered: bool,
+                    prefetch: int) -> Iterator[any]:
+        """Parse the inputs in worker processes, see parse_many"""
+        from concurrent.futures import FIRST_COMPLETED, wait
 
-        token = lexer.nextToken(
-            [x for x in self.table[0] if x.startswith('"')])
+        inputs = iter(inputs)
+        chunks = iter(lambda: list(itertools.islice(inputs, chunksize)), [])
+        pending: deque[tuple[int, "Future"]] = deque()
+        executor = process_pool(workers, _init_worker, (self, ))
+        try:
+            start = 0
+            while True:
+                # Keep the workers busy, within the prefetch limit
+                while len(pending) < workers * prefetch and \
+                        (chunk := next(chunks, None)) is not None:
+                    pending.append(
+                        (start, executor.submit(_worker_parse, chunk)))
+                    start += len(chunk)
+                if not pending:
+                    break
+
+                if ordered:
+                    yield from _unpack(pending.popleft()[1].result())
+                    continue
+                done, _ = wait([future for _, future in pending],
+                               return_when=FIRST_COMPLETED)
+                for item in [item for item in pending if item[1] in done]:
+                    pending.remove(item)
+                    yield from enumerate(_unpack(item[1].result()), item[0])
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    def parse_tokens(self,
+                     lexer: BaseLexer,
+                     stacks: Optional[tuple[list[int], list[any]]] = None
+                     ) -> any:
+        """Parse the tokens from the lexer and provide the final result from
+        callbacks. The states and values stacks are cleared and used if
+        given, instead of new lists."""
+        if stacks is None:
+            states, values = [0], [None]
+        else:
+            states, values = stacks
+            states.clear()
+            states.append(0)
+            values.clear()
+            values.append(None)
+
+        if (result := self._run(lexer, states, values)) is _PENDING:
+            raise EOFError("Unexpected end of the fed input")
+        return result
+
+    def _run(self, lexer: BaseLexer, states: list[int],
+             values: list[any]) -> any:
+        """Run the automaton from the top of the stacks on the tokens of the
+        lexer, until the input is accepted or the lexer needs more input
+        (nextToken returns None, as PushLexer does). Returns the final result
+        or _PENDING, leaving the stacks to resume from."""
+        compiled = self.compiled
+        base, check, value = compiled.base, compiled.check, compiled.value
+        symbols, expected = compiled.symbols, compiled.expected
+        rule_len, rule_lhs = compiled.rule_len, compiled.rule_lhs
+        accept = compiled.accept
+        callbacks = self.callbacks
+
+        state = states[-1]
+        if (token := lexer.nextToken(expected[state])) is None:
+            return _PENDING
+        sym = symbols[token.type]
         while True:
-            if (nxt := self.table[states[-1]].get(token.type, None)) is None:
+            idx = base[state] + sym
+            nxt = value[idx] if check[idx] == state else 0
+
+            if nxt > 0:
+                state = nxt
+                states.append(state)
+                values.append(token.content)
+
+                # Read the next token
+                if (token := lexer.nextToken(expected[state])) is None:
+                    return _PENDING
+                sym = symbols[token.type]
+                continue
+
+            if nxt == 0:
                 if token.type == '$':
                     raise EOFError("Unexpected EOF")
                 raise SyntaxError("Unexpected token",
                                   ("input", 0, 0, token.type))
-            if isinstance(nxt, int):
-                states.append(nxt)
-                tokens.append(token)
 
-                # Read the next token
-                token = lexer.nextToken(
-                    [x for x in self.table[nxt] if x.startswith('"')])
-                continue
+            if nxt == accept:
+                assert len(states) == len(values) == 2
+                return values[1]
 
-            if nxt == 'c':
-                assert len(states) == len(tokens) == 2
-                return tokens[1].content
+            # Reduce RHS to LHS with callback, popping RHS off the stack
+            rule_num = -nxt - 1
+            if rhs_len := rule_len[rule_num]:
+                lhs_content = callbacks[rule_num](*values[-rhs_len:])
+                del values[-rhs_len:]
+                del states[-rhs_len:]
+            else:
+                lhs_content = callbacks[rule_num]()
+            values.append(lhs_content)
 
-            # Get the reduction rule
-            rule_num = int(nxt[1:])
-            rule = self.grammar[rule_num]
+            # Goto
+            state = states[-1]
+            state = value[base[state] + rule_lhs[rule_num]]
+            states.append(state)
 
-            # Get RHS tokens and pop them off the stack
-            rhs_len = -len(rule.rhs) if rule.rhs else len(tokens)
-            rhs_tokens = tokens[rhs_len:]
-            tokens = tokens[:rhs_len]
-            states = states[:rhs_len]
 
-            # Reduce RHS to LHS with callback
-            lhs_content = self.callbacks[rule_num](
-                *[x.content for x in rhs_tokens])
-            lhs_token = Token(rule.lhs, lhs_content)
-            tokens.append(lhs_token)
+class Session:
+    """Session parses inputs one after another with a parser, keeping a
+    single lexer, rebound to each input (see BaseLexer.reset), and the
+    stacks. It saves the setup of the lexer for every input, which dominates
+    the parsing of small inputs:
+    ```
+    session = parser.session()
+    for document in documents:
+        results.append(session.parse(io.StringIO(document)))
+    ```
+    A session must not be used by more than a thread at a time."""
 
-            # Goto
-            nxt = self.table[states[-1]][rule.lhs]
-            states.append(nxt)
+    def __init__(self, parser: Parser):
+        """Initialize the session of the parser"""
+        self.parser = parser
+        self.lexer: Optional[BaseLexer] = None
+        self.stacks: tuple[list[int], list[any]] = ([], [])
+
+    def prepare(self, inpt: Optional[io.RawIOBase] = None):
+        """Set up the lexer of the session, if not yet, and bind it to the
+        input (an empty input if not given)"""
+        if inpt is None:
+            inpt = io.StringIO()
+        parser = self.parser
+        if self.lexer is None:
+            self.lexer = parser.lexerClass(parser.grammar.terminals, inpt,
+                                           parser.whitespaces)
+        else:
+            self.lexer.reset(inpt)
+
+    def parse(self, inpt: Input) -> any:
+        """Parse the input and provide the final result from callbacks. The
+        input is a stream, a path (parsed by Parser.parse_file) or the
+        str/bytes contents."""
+        if isinstance(inpt, os.PathLike):
+            return self.parser.parse_file(inpt)
+        if isinstance(inpt, str):
+            inpt = io.StringIO(inpt)
+        elif isinstance(inpt, (bytes, bytearray)):
+            inpt = io.BytesIO(inpt)
+        self.prepare(inpt)
+        try:
+            return self.parser.parse_tokens(self.lexer, self.stacks)
+        finally:
+            # Release the values for the callbacks
+            self.stacks[1].clear()
+
+
+class IncrementalParser:
+    """IncrementalParser is pushed the input in chunks, as they arrive,
+    instead of pulling it from a stream:
+    ```
+    incremental = parser.incremental()
+    for chunk in chunks:
+        incremental.feed(chunk)
+    result = incremental.close()
+    ```
+    Each chunk is parsed as far as it can be when fed, and the stacks are
+    kept between the chunks. The terminals are matched by the push variant
+    of the lexer class of the parser, so they match as in Parser.parse:
+    PushLexer for Lexer (and its subclasses), which suspends the scan of a
+    token at the end of a chunk, or PushPyRELexer for PyRELexer (and its
+    subclasses), which keeps a window of the input like StreamPyRELexer.
+    Other lexer classes raise TypeError."""
+
+    def __init__(self, parser: Parser):
+        """Initialize the incremental parser for the parser"""
+        self.parser = parser
+        if issubclass(parser.lexerClass, pgen_lexer.Lexer):
+            lexerClass = pgen_lexer.PushLexer
+        elif issubclass(parser.lexerClass, PyRELexer):
+            lexerClass = PushPyRELexer
+        else:
+            raise TypeError(f"No push lexer for {parser.lexerClass!r}")
+        self.lexer = lexerClass(parser.grammar.terminals, parser.whitespaces)
+        self.stacks: tuple[list[int], list[any]] = ([0], [None])
+        self.result = _PENDING
+
+    def feed(self, chunk: Union[str, bytes]):
+        """Parse the next chunk of the input (str, or bytes decoded as
+        UTF-8). Raises the errors of the input seen so far."""
+        assert self.result is _PENDING, "Input is already parsed"
+        self.lexer.feed(chunk)
+        self.result = self.parser._run(self.lexer, *self.stacks)
+
+    def close(self) -> any:
+        """Mark the end of the input and provide the final result from
+        callbacks"""
+        if self.result is _PENDING:
+            self.lexer.close()
+            self.result = self.parser._run(self.lexer, *self.stacks)
+        return self.result
+
+    def reset(self):
+        """Start parsing a new input, keeping the lexer"""
+        self.lexer.reset()
+        self.stacks = ([0], [None])
+        self.result = _PENDING
 
 
-__all__ = ["Parser"]
+__all__ = ["Parser", "Session", "IncrementalParser"]
@@ -0,0 +1,24 @@
+# Copyright 2021 Ilango Rajagopal
+# Licensed under GPL-3.0-only
+
+"""Pools of worker processes, for building the parse tables and parsing
+many inputs"""
+
+from typing import TYPE_CHECKING, Callable
+
+if TYPE_CHECKING:
+    from concurrent.futures import ProcessPoolExecutor
+
+
+def process_pool(workers: int, initializer: Callable,
+                 initargs: tuple) -> "ProcessPoolExecutor":
+    """Returns a pool of worker processes, each initialized by calling
+    initializer with initargs.
+
+    concurrent.futures is imported here, when a pool is first needed, as it
+    imports multiprocessing, which is slow to import and which most users
+    never need."""
+    from concurrent.futures import ProcessPoolExecutor
+    return ProcessPoolExecutor(workers,
+                               initializer=initializer,
+                               initargs=initargs)
@@ -0,0 +1,102 @@
+# Copyright 2021 Ilango Rajagopal
+# Licensed under GPL-3.0-only
+
+"""Compiled, integer encoded form of the LR parse tables.
+
+The parse table given by Grammar.parse_table is a list of dicts keyed by the
+symbols, with shifts/gotos as state numbers, reductions as "r<rule>" strings
+and accept as "c". CompiledTable interns all the symbols to small integers
+(terminals first, $ included, then nonterminals) and encodes every action as
+a single integer:
+- value > 0: Shift to (or goto) state value
+- value < 0: Reduce by rule -value - 1. Reducing by rule len(grammar), the
+  augmented __root__ rule, is accept.
+- value == 0: Error
+
+The actions of all states are packed into flat arrays with row displacement:
+the entry for (state, symbol) lives at index base[state] + symbol of value,
+and is valid only if check at that index is the state. Rows are placed at the
+first displacement where they fit into the gaps of the already placed rows.
+"""
+
+from array import array
+from typing import Union
+
+from pypargen.base.grammar import BaseGrammar
+
+
+class CompiledTable:
+    """CompiledTable is the integer encoded parse table used by the Parser"""
+
+    def __init__(self, grammar: BaseGrammar,
+                 table: list[dict[str, Union[int, str]]]):
+        """Compile the parse table generated for grammar"""
+        self.terminals = ['$'] + grammar.terminals
+        self.nonterminals = grammar.nonterminals
+        self.symbols = {
+            sym: i
+            for i, sym in enumerate(self.terminals + self.nonterminals)
+        }
+        self.accept = -len(grammar) - 1
+
+        self.rule_len = array('i', [len(rule.rhs) for rule in grammar])
+        self.rule_lhs = array('i',
+                              [self.symbols[rule.lhs] for rule in grammar])
+
+        # Terminals expected in each state, in the order of the table, to be
+        # passed on to the lexer
+        self.expected = [[sym for sym in row if sym.startswith('"')]
+                         for row in table]
+
+        rows = [{
+            self.symbols[sym]: self.encode(action)
+            for sym, action in row.items()
+        } for row in table]
+        self._pack(rows)
+
+    def encode(self, action: Union[int, str]) -> int:
+        """Encode the action from parse table as integer"""
+        if isinstance(action, int):
+            return action
+        if action == 'c':
+            return self.accept
+        return -int(action[1:]) - 1
+
+    def _pack(self, rows: list[dict[int, int]]):
+        """Pack the rows into base, check and value arrays"""
+        nsymbols = len(self.symbols)
+        self.base = array('i', [0] * len(rows))
+        check = []
+        value = []
+
+        # Place dense rows first, they are harder to fit
+        for state in sorted(range(len(rows)), key=lambda s: -len(rows[s])):
+            row = rows[state]
+            base = 0
+            while any(base + sym < len(check) and check[base + sym] >= 0
+                      for sym in row):
+                base += 1
+            if (size := base + nsymbols) > len(check):
+                check.extend([-1] * (size - len(check)))
+                value.extend([0] * (size - len(value)))
+            for sym, action in row.items():
+                check[base + sym] = state
+                value[base + sym] = action
+            self.base[state] = base
+
+        self.check = array('i', check)
+        self.value = array('i', value)
+
+    def action(self, state: int, sym: int) -> int:
+        """Returns the encoded action for the state on seeing sym"""
+        idx = self.base[state] + sym
+        if self.check[idx] == state:
+            return self.value[idx]
+        return 0
+
+    def __len__(self) -> int:
+        """Returns the number of states"""
+        return len(self.base)
+
+
+__all__ = ["CompiledTable"]
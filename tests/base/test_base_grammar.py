@@ -2,7 +2,7 @@
 # Licensed under GPL-3.0-only
 
 import pytest
-from pypargen.base import grammar
+from pypargen.base import grammar, rule
 
 
 @pytest.mark.xfail(strict=True, raises=AssertionError)
@@ -67,7 +67,44 @@ def test_eps_recursive():
     grm = grammar.BaseGrammar(rules)
 
     assert grm.start == 'a'
-    assert grm.first(['a', '$']) == ['"b"', '"a"']
+    assert grm.first(['a', '$']) == ['"a"', '"b"']
+
+
+def test_indirect_left_recursion():
+    rules = [('a', ['b', '"a"']), ('b', ['c', '"b"']), ('b', ['"d"']),
+             ('c', ['a', '"c"']), ('c', [])]
+    grm = grammar.BaseGrammar(rules)
+
+    assert grm.first(['a']) == ['"b"', '"d"']
+    assert grm.first(['c']) == ['"b"', '"d"', 'ϵ']
+    assert grm.first(['c', 'c']) == ['"b"', '"d"', 'ϵ']
+    assert grm.first(['c', '"a"']) == ['"a"', '"b"', '"d"']
+    assert grm.first(['c', '$']) == ['"b"', '"d"', '$']
+    assert grm.first([]) == ['ϵ']
+    assert grm.nullable('c') and not grm.nullable('a')
+
+
+def test_follow():
+    rules = [('s', ['a', '"x"']), ('a', ['a', 'b']), ('a', []),
+             ('b', ['"y"']), ('b', ['s', '"z"'])]
+    grm = grammar.BaseGrammar(rules)
+
+    assert grm.follow('s') == ['"z"', '$']
+    assert grm.follow('a') == ['"x"', '"y"']
+    assert grm.follow('b') == ['"x"', '"y"']
+
+
+def test_mutation():
+    grm = grammar.BaseGrammar([('a', ['"a"'])])
+    assert grm.first(['a']) == ['"a"']
+
+    grm.append(rule.Rule('a', ['b']))
+    grm.append(rule.Rule('b', []))
+    assert grm.first(['a']) == ['"a"', 'ϵ']
+    del grm[1]
+    assert grm.first(['a']) == ['"a"']
+    grm[0] = rule.Rule('a', ['"b"'])
+    assert grm.first(['a']) == ['"b"']
 
 
 @pytest.mark.xfail(strict=True, raises=AssertionError)
@@ -88,3 +125,30 @@ def test_invalid_start_set():
     g = grammar.BaseGrammar([('S', ['"a"', 'S', '"a"']),
                              ('S', ['"b"', 'S', '"b"']), ('S', [])])
     g.start = 'T'
+
+
+def test_indexes():
+    grm = grammar.BaseGrammar([('a', ['b', '"x"']), ('b', ['"y"']),
+                               ('a', ['"z"']), ('b', ['"y"'])])
+    assert grm.rules_by_lhs == {'a': [0, 2], 'b': [1, 3]}
+    assert grm.rule_number('b', ['"y"']) == grm.index(('b', ['"y"'])) == 1
+    assert grm.rule_number('a', ('"z"', )) == 2
+    with pytest.raises(ValueError):
+        grm.rule_number('a', ['"y"'])
+
+    assert grm.terminals is grm.terminals
+    grm.insert(0, rule.Rule('c', ['"w"']))
+    assert grm.terminals == ['"w"', '"x"', '"y"', '"z"']
+    assert grm.nonterminals == ['c', 'a', 'b']
+    assert grm.rules_by_lhs == {'c': [0], 'a': [1, 3], 'b': [2, 4]}
+    assert grm.rule_number('b', ['"y"']) == 2
+
+
+def test_large_grammar():
+    # Chain of 2000 rules: n0 -> "t0" n1, ..., n1999 -> "t1999"
+    rules = [(f"n{i}", [f'"t{i}"', f"n{i + 1}"]) for i in range(1999)]
+    rules.append(("n1999", ['"t1999"']))
+    grm = grammar.BaseGrammar(rules)
+    assert len(grm.terminals) == len(grm.nonterminals) == 2000
+    assert grm.rule_number("n1500", ['"t1500"', "n1501"]) == 1500
+    assert grm.first(["n1000"]) == ['"t1000"']
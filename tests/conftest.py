@@ -0,0 +1,33 @@
+# Copyright 2021 Ilango Rajagopal
+# Licensed under GPL-3.0-only
+
+import os
+import pytest
+from pypargen.lr1 import grammar
+from pypargen.grm.grammar import grammar as grm_grammar
+
+
+@pytest.fixture(autouse=True, scope="session")
+def table_cache_dir(tmp_path_factory):
+    """Keep the parse table cache of the test session out of the user's
+    cache directory"""
+    directory = tmp_path_factory.mktemp("tables")
+    old = os.environ.get("PYPARGEN_CACHE_DIR")
+    os.environ["PYPARGEN_CACHE_DIR"] = str(directory)
+    yield directory
+    if old is None:
+        del os.environ["PYPARGEN_CACHE_DIR"]
+    else:
+        os.environ["PYPARGEN_CACHE_DIR"] = old
+
+
+@pytest.fixture
+def palindrome():
+    return grammar.Grammar([('S', ['"a"', 'S', '"a"']),
+                            ('S', ['"b"', 'S', '"b"']), ('S', ['"c"'])])
+
+
+@pytest.fixture(params=["palindrome", "grm"])
+def sample_grammar(request, palindrome):
+    """The palindrome grammar and the grammar of grm files"""
+    return palindrome if request.param == "palindrome" else grm_grammar
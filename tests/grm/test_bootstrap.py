@@ -1,13 +1,11 @@
 # Copyright 2021 Ilango Rajagopal
 # Licensed under GPL-3.0-only
 
-import pytest
 import pathlib
 import io
 from pypargen.grm import parser
 
 
-@pytest.mark.slow
 def test_bootstrap():
     grm_file = pathlib.Path(__file__).parent / "grammar.grm"
     grm_parser = parser.GrmParser()
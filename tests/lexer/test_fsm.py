@@ -2,7 +2,7 @@
 # Licensed under GPL-3.0-only
 
 import pytest
-from pypargen.lexer import fsm
+from pypargen.lexer import fsm, re
 
 
 def test_nfa_node_id():
@@ -159,3 +159,108 @@ def test_combine_dfa():
     assert hhDFA.match('holahello') == ({'hola'}, 4)
     assert hhDFA.match('hellohola') == ({'hello'}, 5)
     assert not hhDFA.match('helo')
+
+
+def test_dfa_cached_transitions():
+    nfa = fsm.NFA(end=fsm.NFANode("end"))
+    nfa.start.add_chars_transition("ab", nfa.start)
+    nfa.start.add_transition('c', nfa.end)
+
+    dfa = fsm.DFA(nfa)
+    assert dfa.match("ababc") == ({"end"}, 5)
+    assert len(dfa.nodes) == 2
+    assert dfa.transitions[dfa.start] == {'a': 0, 'b': 0, 'c': 1}
+
+    # Transitions are not computed again
+    dfa.nodes[dfa.start] = None
+    assert dfa.match("bbac") == ({"end"}, 4)
+    assert dfa.move(1, 'a') == -1
+
+
+def test_dfa_state_ids():
+    a = fsm.NFANode()
+    b = fsm.NFANode('b')
+    a.add_transition('', b)
+
+    dfa = fsm.DFA()
+    assert dfa.state({a}) == dfa.state({a, b}) == 0
+    assert dfa.state({b}) == 1
+    assert dfa.state(set()) == -1
+    assert dfa.tokens == [{'b'}, {'b'}]
+
+
+def test_dfa_minimize():
+    # Dragon book example: (a|b)*abb
+    compiled = re.compile('(a|b)*abb')
+    assert len(compiled.nodes) == 4
+    assert compiled.match("ababb") == ({"match"}, 5)
+    assert not compiled.match("abab")
+
+    # Final states are merged only if their tokens are the same
+    nfa = fsm.NFA()
+    for char, token in [('x', 'a'), ('y', 'b'), ('z', 'a')]:
+        nfa.start.add_transition(char, fsm.NFANode(token))
+
+    dfa = fsm.DFA(nfa)
+    assert len(dfa.explore([dfa.start])) == 4
+    minimal, starts = dfa.minimize([dfa.start, -1])
+    assert len(minimal.nodes) == 3
+    assert starts == [0, -1]
+    classify = minimal.alphabet.classify
+    assert minimal.table[0] == {
+        classify('x'): 1,
+        classify('y'): 2,
+        classify('z'): 1
+    }
+    assert minimal.tokens[1:] == [{'a'}, {'b'}]
+    minimal.start = 0
+    for string in ("x", "y", "z", "zz", "", "w"):
+        assert minimal.match(string) == dfa.match(string)
+
+
+def test_dfa_minimize_dead():
+    # No state accepts: the language is empty
+    nfa = fsm.NFA()
+    nfa.start.add_transition('a', nfa.end)
+    dfa = fsm.DFA(nfa)
+    minimal, starts = dfa.minimize([dfa.start])
+    assert minimal.nodes == [] and starts == [-1]
+
+    # States that cannot reach the accepting ones die
+    nfa.start.add_transition('b', fsm.NFANode("b"))
+    nfa.end.add_transition('c', fsm.NFANode())
+    dfa = fsm.DFA(nfa)
+    assert len(dfa.explore([dfa.start])) == 4
+    minimal, (minimal.start, ) = dfa.minimize([dfa.start])
+    assert len(minimal.nodes) == 2
+    assert minimal.match("b") == ({"b"}, 1)
+    assert not minimal.match("ac")
+
+
+def test_alphabet():
+    nfa = fsm.NFA()
+    nfa.start.add_range_transition('a', 'z', nfa.end)
+    nfa.start.add_transition('x', fsm.NFANode('x'))
+    alphabet = fsm.Alphabet([nfa.start])
+    classify = alphabet.classify
+
+    assert alphabet.size == 3
+    assert classify('a') == classify('w') == classify('z') != classify('x')
+    assert classify('A') == classify('é') == 0
+    assert alphabet.ranges(classify('a')) == [(ord('a'), ord('w')),
+                                              (ord('y'), ord('z'))]
+    assert alphabet.ranges(classify('x')) == [(ord('x'), ord('x'))]
+
+
+def test_dfa_unicode_range():
+    nfa = fsm.NFA()
+    word = fsm.NFANode("word")
+    nfa.start.add_range_transition('Ā', '￿', word)
+    word.add_range_transition('Ā', '￿', word)
+    word.add_transition('a', word)
+
+    dfa = fsm.DFA(nfa)
+    assert dfa.alphabet.size == 3
+    assert dfa.match("Ā中a￿") == ({"word"}, 4)
+    assert not dfa.match("aĀ")
+    assert dfa.match("Āÿ") == ({"word"}, 1)
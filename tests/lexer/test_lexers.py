@@ -1,13 +1,16 @@
 # Copyright 2021 Ilango Rajagopal
 # Licensed under GPL-3.0-only
 
+from concurrent.futures import ThreadPoolExecutor
 import pytest
 import io
 import re
-from pypargen.lexer import pyre, lexer
+from pypargen.lexer import pyre, lexer, scanner
+from pypargen.lexer import re as pre
 
 
-@pytest.mark.parametrize("lexerClass", [pyre.PyRELexer, lexer.Lexer])
+@pytest.mark.parametrize("lexerClass",
+                         [pyre.PyRELexer, lexer.Lexer, scanner.ScannerLexer])
 def test_whitespaces(lexerClass):
     terminals = ['"a"', '"b"']
     input = "	a a b 	b"
@@ -26,7 +29,8 @@ def test_whitespaces(lexerClass):
             ] == [terminals[i] for i in true_token_types] + ['$']
 
 
-@pytest.mark.parametrize("lexerClass", [pyre.PyRELexer, lexer.Lexer])
+@pytest.mark.parametrize("lexerClass",
+                         [pyre.PyRELexer, lexer.Lexer, scanner.ScannerLexer])
 def test_palindrome(lexerClass):
     terminals = ['"a"', '"b"']
     input = "aabb"
@@ -43,7 +47,8 @@ def test_palindrome(lexerClass):
             ] == [terminals[i] for i in true_token_types] + ['$']
 
 
-@pytest.mark.parametrize("lexerClass", [pyre.PyRELexer, lexer.Lexer])
+@pytest.mark.parametrize("lexerClass",
+                         [pyre.PyRELexer, lexer.Lexer, scanner.ScannerLexer])
 def test_math(lexerClass):
     terminals = [
         '"[1-9][0-9]*"', r'"\("', r'"\)"', '"/"', r'"\*"', r'"\+"', '"-"'
@@ -51,7 +56,7 @@ def test_math(lexerClass):
     input = "(1+2)/(4-1)"
     inputbuf = io.BytesIO(input.encode())
 
-    if lexerClass == lexer.Lexer:
+    if issubclass(lexerClass, lexer.Lexer):
         terminals[5] = '"+"'
     lexer1 = lexerClass(terminals, inputbuf)
     assert lexer1.terminals == terminals
@@ -65,7 +70,8 @@ def test_math(lexerClass):
             ] == [terminals[i] for i in true_token_types] + ['$']
 
 
-@pytest.mark.parametrize("lexerClass", [pyre.PyRELexer, lexer.Lexer])
+@pytest.mark.parametrize("lexerClass",
+                         [pyre.PyRELexer, lexer.Lexer, scanner.ScannerLexer])
 @pytest.mark.xfail(strict=True, raises=pyre.UnexpectedCharacter)
 def test_invalid(lexerClass):
     terminals = ['"a"', '"b"']
@@ -77,7 +83,8 @@ def test_invalid(lexerClass):
     list(lexer1)
 
 
-@pytest.mark.parametrize("lexerClass", [pyre.PyRELexer, lexer.Lexer])
+@pytest.mark.parametrize("lexerClass",
+                         [pyre.PyRELexer, lexer.Lexer, scanner.ScannerLexer])
 def test_active(lexerClass):
     terminals = ['"[a-z]"', '"[A-Za-z]"']
     inputstr = "abcAbc"
@@ -93,7 +100,8 @@ def test_active(lexerClass):
         i += 1
 
 
-@pytest.mark.parametrize("lexerClass", [pyre.PyRELexer, lexer.Lexer])
+@pytest.mark.parametrize("lexerClass",
+                         [pyre.PyRELexer, lexer.Lexer, scanner.ScannerLexer])
 @pytest.mark.xfail(strict=True, raises=pyre.UnregisteredTerminal)
 def test_active_invalid(lexerClass):
     terminals = ['"[a-z]"', '"[A-Za-z]"']
@@ -109,3 +117,249 @@ def test_active_invalid(lexerClass):
         if i == 3:
             terminals = ['"[A-Z]"']
     raise RuntimeError("Should not reach here")
+
+
+def test_shared_automaton():
+    terminals = ['"[a-z][a-z]*"', '"[0-9][0-9]*"']
+    lexer1 = lexer.Lexer(terminals, io.StringIO("abc12"))
+    lexer2 = lexer.Lexer(terminals.copy(), io.StringIO("12abc"))
+    assert lexer1.dfa is lexer2.dfa
+
+    assert [x.content for x in lexer1] == ["abc", "12", None]
+    states = len(lexer1.dfa.nodes)
+    # Second lexer only walks through the cached states
+    assert [x.content for x in lexer2] == ["12", "abc", None]
+    assert len(lexer2.dfa.nodes) == states
+
+    lexer3 = lexer.Lexer(terminals[:1], io.StringIO("abc"))
+    assert lexer3.dfa is not lexer1.dfa
+    # NFAs of the terminals are shared by the automata
+    assert lexer3.nfa_starts[terminals[0]] is lexer1.nfa_starts[terminals[0]]
+
+
+def test_terminal_nfa_threads():
+    assert pre.parser() is pre.parser()
+    terminals = [f'"{word}[0-9]*"' for word in ("ab", "cd", "ef", "gh")] * 8
+    with ThreadPoolExecutor(4) as executor:
+        nfas = list(executor.map(lexer.terminal_nfa, terminals))
+    for term, nfa in zip(terminals, nfas):
+        assert nfa.end.token == term
+        assert lexer.terminal_nfa(term) is lexer.terminal_nfa(term)
+    info = lexer.terminal_nfa.cache_info()
+    assert info.maxsize == 1024 and info.hits > 0
+
+
+def test_start_cache():
+    terminals = ['"x"', '"[a-z]"', '"[0-9]"']
+    auto = lexer.Automaton(terminals, maxstarts=2)
+    assert auto.cache_info() == lexer.CacheInfo(0, 0, 2, 0)
+
+    start = auto.start(terminals)
+    assert auto.start(list(reversed(terminals))) == start
+    assert auto.cache_info() == lexer.CacheInfo(1, 1, 2, 1)
+
+    auto.start(terminals[1:])
+    auto.start(terminals)
+    # Least recently used is evicted
+    auto.start(terminals[2:])
+    assert auto.cache_info() == lexer.CacheInfo(2, 3, 2, 2)
+    auto.start(terminals)
+    assert auto.cache_info().hits == 3
+    auto.start(terminals[1:])
+    assert auto.cache_info().misses == 4
+
+    with pytest.raises(lexer.UnregisteredTerminal):
+        auto.start(['"y"'])
+
+
+def test_start_cache_lexer():
+    terminals = ['"[a-z]"', '"[0-9]"']
+    lexer1 = lexer.Lexer(terminals, io.StringIO("a1b2c3"))
+    info = lexer1.automaton.cache_info()
+    while lexer1.nextToken(terminals[:1]).type != '$':
+        lexer1.nextToken(terminals[1:])
+    # Only the first lookup for each active set is a miss
+    new_info = lexer1.automaton.cache_info()
+    assert new_info.misses - info.misses <= 2
+    assert new_info.hits - info.hits >= 4
+
+
+@pytest.mark.parametrize("lexerClass", [lexer.Lexer, scanner.ScannerLexer])
+@pytest.mark.parametrize("bufsize", [1, 2, 3, 7, None])
+@pytest.mark.parametrize("binary", [False, True])
+def test_chunks(lexerClass, bufsize, binary):
+    terminals = ['"[a-zϵ][a-zϵ]*"', '"[0-9][0-9]*"']
+    inputstr = "hϵllo 12345  wϵϵrld 6"
+    inputbuf = io.BytesIO(inputstr.encode()) if binary else \
+        io.StringIO(inputstr)
+    lexer1 = lexerClass(terminals, inputbuf, " ", bufsize=bufsize)
+
+    assert [x.content for x in lexer1] == inputstr.split() + [None]
+    assert lexer1.pos == len(inputstr)
+
+
+@pytest.mark.parametrize("lexerClass", [lexer.Lexer, scanner.ScannerLexer])
+@pytest.mark.xfail(strict=True, raises=lexer.UnexpectedCharacter)
+def test_chunks_invalid(lexerClass):
+    lexer1 = lexerClass(['"ab"'], io.StringIO("abac"), bufsize=3)
+    assert lexer1.nextToken().content == "ab"
+    lexer1.nextToken()
+
+
+@pytest.mark.parametrize("lexerClass", [
+    pyre.PyRELexer, pyre.StreamPyRELexer, lexer.Lexer, scanner.ScannerLexer
+])
+def test_reset(lexerClass):
+    terminals = ['"[a-z][a-z]*"', '"[0-9][0-9]*"']
+    lexer1 = lexerClass(terminals, io.StringIO("abc 12"), " ")
+    assert [x.content for x in lexer1] == ["abc", "12", None]
+
+    # Input left in the middle, binary input
+    lexer1.reset(io.BytesIO("34 xyz".encode()))
+    assert lexer1.nextToken().content == "34"
+    lexer1.reset(io.StringIO("de 5"))
+    assert [x.content for x in lexer1] == ["de", "5", None]
+    assert lexer1.pos == 4
+
+
+def test_reset_mmap():
+    lexer1 = pyre.MMapLexer(['"[a-z]+"'], b"abc de", " ", decode=False)
+    assert bytes(lexer1.nextToken().content) == b"abc"
+    lexer1.reset(b"fg")
+    assert bytes(lexer1.nextToken().content) == b"fg"
+    assert lexer1.nextToken().type == '$'
+
+
+def test_push_lexer():
+    terminals = ['"[a-zϵ][a-zϵ]*"', '"[0-9][0-9]*"']
+    lexer1 = lexer.PushLexer(terminals, " ")
+    assert lexer1.nextToken() is None
+    lexer1.feed("12 a")
+    assert lexer1.nextToken().content == "12"
+    # Scan of "a" is suspended till the next chunks
+    assert lexer1.nextToken() is None
+    lexer1.feed("b")
+    assert lexer1.nextToken() is None
+    lexer1.feed("ϵ".encode()[:1])
+    lexer1.feed("ϵ".encode()[1:] + b"c 3")
+    assert lexer1.nextToken().content == "abϵc"
+    assert lexer1.nextToken() is None
+    # Consumed input is discarded
+    lexer1.feed("4 ")
+    assert lexer1.chunk == "34 "
+    lexer1.close()
+    assert [x.content for x in lexer1] == ["34", None]
+    assert lexer1.pos == 11
+
+    lexer1.reset("x")
+    lexer1.close()
+    assert lexer1.nextToken().content == "x"
+
+
+def test_push_pyre():
+    terminals = ['"[a-zϵ]+"', '"[0-9]+"']
+    lexer1 = pyre.PushPyRELexer(terminals, " ", bufsize=4)
+    lexer1.feed("12 ab")
+    assert lexer1.nextToken().content == "12"
+    # Less than bufsize characters after the token
+    assert lexer1.nextToken() is None
+    lexer1.feed("ϵ".encode()[:1])
+    lexer1.feed("ϵ".encode()[1:] + b"c 34 ")
+    assert lexer1.nextToken().content == "abϵc"
+    assert lexer1.nextToken() is None
+    lexer1.close()
+    assert [x.content for x in lexer1] == ["34", None]
+    assert lexer1.pos == 11
+
+
+@pytest.mark.xfail(strict=True, raises=lexer.UnexpectedCharacter)
+def test_push_lexer_invalid():
+    lexer1 = lexer.PushLexer(['"ab"'])
+    lexer1.feed("a")
+    assert lexer1.nextToken() is None
+    lexer1.feed("c")
+    lexer1.nextToken()
+
+
+def test_scanner():
+    terminals = ['"[a-z][a-z]*"', '"[0-9][0-9]*"', '"if"']
+    lexer1 = scanner.ScannerLexer(terminals, io.StringIO("if 12 iff"), " ")
+    compiled = lexer1.scanner
+    assert compiled is scanner.scanner(terminals)
+    assert compiled.automaton is lexer.automaton(terminals)
+
+    # Priority follows the active terminals, as in Lexer
+    assert lexer1.nextToken().type == '"[a-z][a-z]*"'
+    assert lexer1.nextToken(terminals[1:]).content == "12"
+    assert lexer1.nextToken(terminals[::-1]).type == '"[a-z][a-z]*"'
+    assert lexer1.nextToken().type == '$'
+
+    # Minimal DFA of digits has two states, the second looping on digits
+    functions, state, accepts = compiled.start(['"[0-9][0-9]*"'])
+    assert len(functions) == 2
+    assert functions[state]("421x", 0, 4) == (1, 1)
+    assert functions[1]("421x", 1, 4) == (-1, 3)
+    assert accepts == {1: '"[0-9][0-9]*"'}
+    assert "re.compile('[0-9]*').match" in compiled.sources[-1]
+
+    # Special characters of re in the runs
+    terminals2 = [r'"[-^\]a][-^\]a]*"']
+    lexer2 = scanner.ScannerLexer(terminals2, io.StringIO("a-^]a ]]"), " ")
+    assert [x.content for x in lexer2] == ["a-^]a", "]]", None]
+
+    # Compiled once for all the lexers
+    sources = len(compiled.sources)
+    scanner.ScannerLexer(terminals, io.StringIO("ab 1"), " ").nextToken()
+    assert len(compiled.sources) == sources
+
+
+@pytest.mark.parametrize("bufsize", [4, 5, 16])
+@pytest.mark.parametrize("binary", [False, True])
+def test_stream_pyre(bufsize, binary):
+    terminals = ['"[a-zϵ]+"', '"[0-9]+"', r'"[0-9]+\.[0-9]+"']
+    inputstr = "hϵllo 12345  wϵϵrld 6 1.5 " * 3
+    inputbuf = io.BytesIO(inputstr.encode()) if binary else \
+        io.StringIO(inputstr)
+    lexer1 = pyre.PyRELexer(terminals, inputbuf, " ", bufsize=bufsize)
+
+    tokens = []
+    while (tok := lexer1.nextToken(terminals[::-1])).type != '$':
+        tokens.append(tok.content)
+        # Consumed text is discarded
+        assert len(lexer1.str) <= 3 * bufsize + len("wϵϵrld")
+    assert tokens == inputstr.split()
+    assert lexer1.pos == len(inputstr)
+
+
+def test_stream_pyre_class():
+    assert pyre.StreamPyRELexer.bufsize
+    lexer1 = pyre.StreamPyRELexer(['"a+"'], io.StringIO("a" * 100000))
+    assert lexer1.nextToken().content == "a" * 100000
+    assert lexer1.nextToken().type == '$'
+
+
+def test_master_pattern():
+    terminals = ('"if"', '"[a-z]+"', '"(?P<t0>x)y"')
+    pattern, groups = pyre.master_pattern(terminals[:2])
+    assert groups == {"t0": '"if"', "t1": '"[a-z]+"'}
+    # First alternative wins, like trying the terminals in order
+    assert pattern.match("iffy").lastgroup == "t0"
+    assert pattern.match("fifi").lastgroup == "t1"
+    assert pyre.master_pattern(terminals[:2])[0] is pattern
+
+    # Clashing group names can't be combined
+    assert pyre.master_pattern(terminals)[0] is None
+    # Nor references to groups, renumbered in the combined pattern
+    assert pyre.master_pattern(('"x"', r'"(a|b)\1"'))[0] is None
+    assert pyre.master_pattern(('"x"', '"(?P<c>a)(?P=c)"'))[0] is None
+    assert pyre.master_pattern(('"x"', '"(a|b)*"'))[0] is not None
+
+
+def test_pyre_uncombinable():
+    terminals = ['"(?P<t1>a)b"', '"a"']
+    lexer1 = pyre.PyRELexer(terminals, io.StringIO("aba"))
+    assert [x.type for x in lexer1] == terminals + ['$']
+
+    terminals = ['"x"', r'"(a|b)\1"']
+    lexer1 = pyre.PyRELexer(terminals, io.StringIO("bbxaa"))
+    assert [x.content for x in lexer1] == ["bb", "x", "aa", None]
@@ -0,0 +1,89 @@
+# Copyright 2021 Ilango Rajagopal
+# Licensed under GPL-3.0-only
+
+import io
+import json
+import pytest
+from pypargen.lr1 import cache, grammar, parser
+
+
+def test_key(palindrome: grammar.Grammar):
+    same = grammar.Grammar(list(palindrome))
+    assert cache.grammar_key(palindrome) == cache.grammar_key(same)
+
+    reordered = grammar.Grammar(list(reversed(palindrome)), 'S')
+    assert cache.grammar_key(palindrome) != cache.grammar_key(reordered)
+
+    palindrome.append(('T', ['S']))
+    assert cache.grammar_key(palindrome) != cache.grammar_key(same)
+    palindrome.start = 'T'
+    assert cache.grammar_key(palindrome) != cache.grammar_key(same)
+
+    lalr1 = grammar.Grammar(list(same), mode="lalr1")
+    assert cache.grammar_key(lalr1) != cache.grammar_key(same)
+
+
+def test_dump_load(palindrome: grammar.Grammar):
+    table = palindrome.parse_table()
+    buf = io.StringIO()
+    cache.dump_table(palindrome, table, buf)
+    buf.seek(0)
+    assert cache.load_table(palindrome, buf) == table
+
+
+def test_load_stale(palindrome: grammar.Grammar):
+    buf = io.StringIO()
+    cache.dump_table(palindrome, palindrome.parse_table(), buf)
+
+    other = grammar.Grammar([('S', ['"a"'])])
+    with pytest.raises(cache.StaleTable):
+        cache.load_table(other, io.StringIO(buf.getvalue()))
+
+    artifact = json.loads(buf.getvalue())
+    artifact["version"] = cache.TABLE_VERSION + 1
+    with pytest.raises(cache.StaleTable):
+        cache.load_table(palindrome, io.StringIO(json.dumps(artifact)))
+
+    with pytest.raises(cache.StaleTable):
+        cache.load_table(palindrome, io.StringIO("{broken"))
+
+
+def test_cache_populate(palindrome: grammar.Grammar, tmp_path):
+    tables = cache.TableCache(tmp_path / "tables")
+    assert tables.get(palindrome) is None
+
+    table = tables.parse_table(palindrome)
+    assert tables.path(palindrome).exists()
+    assert tables.get(palindrome) == table
+
+    # A corrupt artifact is ignored and replaced
+    tables.path(palindrome).write_text("corrupt")
+    assert tables.get(palindrome) is None
+    assert tables.parse_table(palindrome) == table
+    assert tables.get(palindrome) == table
+
+
+def test_parser_uses_cache(palindrome: grammar.Grammar, tmp_path,
+                           monkeypatch):
+    tables = cache.TableCache(tmp_path)
+    p = parser.Parser(palindrome, [lambda *x: ''.join(x)] * 3, cache=tables)
+    assert tables.get(palindrome) == p.table
+
+    def fail():
+        raise AssertionError("Table must be loaded from cache")
+
+    monkeypatch.setattr(palindrome, "parse_table", fail)
+    p = parser.Parser(palindrome, [lambda *x: ''.join(x)] * 3, cache=tables)
+    assert p.parse(io.StringIO("abcba")) == "abcba"
+
+
+def test_default_directory(monkeypatch, tmp_path):
+    monkeypatch.setenv("PYPARGEN_CACHE_DIR", str(tmp_path))
+    assert cache.TableCache.default().directory == tmp_path
+
+    monkeypatch.setenv("PYPARGEN_CACHE_DIR", "")
+    assert cache.TableCache.default() is None
+
+    monkeypatch.delenv("PYPARGEN_CACHE_DIR")
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    assert cache.default_directory() == tmp_path / "pypargen"
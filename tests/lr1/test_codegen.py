@@ -0,0 +1,102 @@
+# Copyright 2021 Ilango Rajagopal
+# Licensed under GPL-3.0-only
+
+import io
+import pathlib
+import subprocess
+import sys
+import pytest
+from pypargen.lr1 import codegen, grammar, parser
+from pypargen.lexer import Lexer
+
+CALLBACKS = '''
+def pair(key, _, value):
+    return (key, int(value))
+
+
+def single(pair):
+    return {pair[0]: pair[1]}
+
+
+def more(pairs, _, pair):
+    pairs[pair[0]] = pair[1]
+    return pairs
+
+
+class Rules:
+    @staticmethod
+    def braces(_, pairs, __):
+        return pairs
+'''
+
+
+@pytest.fixture
+def pairs(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch):
+    (tmp_path / "pair_callbacks.py").write_text(CALLBACKS)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    import pair_callbacks
+    rules = [("obj", ['"{"', "pairs", '"}"']), ("pairs", ["pair"]),
+             ("pairs", ["pairs", '","', "pair"]),
+             ("pair", ['"[a-z][a-z]*"', '":"', '"[0-9][0-9]*"'])]
+    callbacks = [
+        pair_callbacks.Rules.braces, pair_callbacks.single,
+        pair_callbacks.more, pair_callbacks.pair
+    ]
+    yield grammar.Grammar(rules, "obj"), callbacks
+    del sys.modules["pair_callbacks"]
+
+
+def test_generate(tmp_path: pathlib.Path, pairs):
+    grm, callbacks = pairs
+    src = codegen.generate_parser(grm, callbacks, " \n")
+    (tmp_path / "pairs_parser.py").write_text(src)
+    import pairs_parser
+
+    inpt = "{a: 1, bc: 23,\n d:4}"
+    result = parser.Parser(grm, callbacks, Lexer, " \n").parse(
+        io.StringIO(inpt))
+    assert result == {"a": 1, "bc": 23, "d": 4}
+    assert pairs_parser.parse(io.StringIO(inpt)) == result
+    assert pairs_parser.parse(inpt.encode()) == result
+    assert pairs_parser.parse(io.BytesIO(inpt.encode())) == result
+
+    with pytest.raises(SyntaxError):
+        pairs_parser.parse("{a: 1 b: 2}")
+    with pytest.raises(SyntaxError):
+        pairs_parser.parse("{a: x}")
+    with pytest.raises(EOFError):
+        pairs_parser.parse("{a: 1,")
+    del sys.modules["pairs_parser"]
+
+
+def test_generate_standalone(tmp_path: pathlib.Path, pairs):
+    grm, callbacks = pairs
+    src = codegen.generate_parser(grm, callbacks)
+    (tmp_path / "pairs_parser.py").write_text(src)
+    (tmp_path / "input.txt").write_text("{ab:12,c:3}")
+
+    # Only the callbacks module is importable besides the generated one
+    script = ("import sys\n"
+              "sys.path.insert(0, '.')\n"
+              "import pairs_parser\n"
+              "assert not any(m.startswith('pypargen') for m in sys.modules)\n"
+              "print(pairs_parser.parse_file('input.txt'))")
+    out = subprocess.run([sys.executable, "-I", "-c", script],
+                         cwd=tmp_path,
+                         capture_output=True,
+                         text=True,
+                         check=False)
+    assert out.stderr == ""
+    assert out.stdout == "{'ab': 12, 'c': 3}\n"
+
+
+def test_generate_not_importable(pairs):
+    grm, callbacks = pairs
+    with pytest.raises(ValueError):
+        codegen.generate_parser(grm, [lambda *x: x] * len(grm))
+
+    def nested(*args):
+        return args
+
+    with pytest.raises(ValueError):
+        codegen.generate_parser(grm, [nested] * len(grm))
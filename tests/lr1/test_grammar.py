@@ -1,6 +1,7 @@
 # Copyright 2021 Ilango Rajagopal
 # Licensed under GPL-3.0-only
 
+import pathlib
 import pytest
 from pypargen.lr1 import grammar
 
@@ -30,12 +31,6 @@ def test_item_copy(item: grammar.Item):
     assert item2.done
 
 
-@pytest.fixture
-def palindrome():
-    return grammar.Grammar([('S', ['"a"', 'S', '"a"']),
-                            ('S', ['"b"', 'S', '"b"']), ('S', ['"c"'])])
-
-
 def test_closure_palindrome(palindrome: grammar.Grammar):
     items = [grammar.Item('S', ['"a"', 'S', '"a"'], 0, '"a"')]
     closure = palindrome.closure(items)
@@ -82,8 +77,14 @@ def test_goto_palindrome(palindrome: grammar.Grammar):
 
 
 def test_table_palindrome(palindrome: grammar.Grammar):
-    # TODO: Check the parse table
-    palindrome.parse_table()
+    table = palindrome.parse_table()
+    # Canonical LR(1): one state per (prefix, lookahead) combination
+    assert len(table) == 23
+    assert table[0] == {'"a"': 1, '"b"': 2, '"c"': 3, 'S': 4}
+    assert table[3] == {'$': 'r2'}
+    assert table[4] == {'$': 'c'}
+    # Each state is found once, so states are numbered deterministically
+    assert table == palindrome.parse_table()
 
 
 @pytest.mark.xfail(strict=True, raises=grammar.ReduceReduceConflict)
@@ -94,6 +95,14 @@ def test_table_lr2():
     grm.parse_table()
 
 
+@pytest.mark.parametrize("mode", grammar.Grammar.modes)
+def test_table_cyclic_start(mode: str):
+    # Reducing A -> A conflicts with accepting A
+    grm = grammar.Grammar([('A', ['A'])], mode=mode)
+    with pytest.raises(grammar.ReduceReduceConflict, match="__root__"):
+        grm.parse_table()
+
+
 @pytest.mark.xfail(strict=True, raises=grammar.ShiftReduceConflict)
 def test_table_pda():
     palindrome = grammar.Grammar([('S', ['"a"', 'S', '"a"']),
@@ -106,3 +115,129 @@ def test_eps_grammar():
                          ('c', ['c', '"c"']), ('c', ['"c"'])])
     # TODO: Check parse table
     g.parse_table()
+
+
+def test_lalr1_palindrome(palindrome: grammar.Grammar):
+    palindrome.mode = "lalr1"
+    table = palindrome.parse_table()
+    # States of LR(0) automaton: 1 + (a, b, c, S) + (aS, bS) + (aSa, bSb)
+    assert len(table) == 9
+    assert table[0] == {'"a"': 1, '"b"': 2, '"c"': 3, 'S': 4}
+    assert table[3] == {'"a"': 'r2', '"b"': 'r2', '$': 'r2'}
+    assert table[4] == {'$': 'c'}
+
+
+def test_lalr1_eps_grammar():
+    g = grammar.Grammar([('a', ['b', 'c']), ('b', []), ('b', ['"b"']),
+                         ('c', ['c', '"c"']), ('c', ['"c"'])],
+                        mode="lalr1")
+    g.mode = "lr1"
+    lr1_table = g.parse_table()
+    g.mode = "lalr1"
+    # Canonical LR(1) has no state with same core here
+    assert g.parse_table() == lr1_table
+
+
+@pytest.mark.xfail(strict=True, raises=grammar.ReduceReduceConflict)
+def test_lalr1_not_lalr():
+    # LR(1), but merging the states after "a c" and "b c" gives conflict
+    grm = grammar.Grammar(not_lalr_rules())
+    grm.parse_table()
+    grm.mode = "lalr1"
+    grm.parse_table()
+
+
+@pytest.mark.xfail(strict=True, raises=grammar.ShiftReduceConflict)
+def test_lalr1_pda():
+    palindrome = grammar.Grammar([('S', ['"a"', 'S', '"a"']),
+                                  ('S', ['"b"', 'S', '"b"']), ('S', [])],
+                                 mode="lalr1")
+    palindrome.parse_table()
+
+
+def assert_lr1_equivalent(canonical: list, minimal: list):
+    """Walk both tables from the start state and check that every action
+    of canonical LR(1) table is taken by the other one too"""
+    states = {0: 0}
+    stack = [0]
+    while stack:
+        row = minimal[states[state := stack.pop()]]
+        for sym, action in canonical[state].items():
+            if not isinstance(action, int):
+                assert row[sym] == action
+                continue
+            assert isinstance(row[sym], int)
+            if action not in states:
+                states[action] = row[sym]
+                stack.append(action)
+            assert states[action] == row[sym]
+
+
+def not_lalr_rules():
+    return [("S", ['"a"', 'A', '"d"']), ("S", ['"b"', 'B', '"d"']),
+            ("S", ['"a"', 'B', '"e"']), ("S", ['"b"', 'A', '"e"']),
+            ("A", ['"c"']), ("B", ['"c"'])]
+
+
+def test_pager_palindrome(palindrome: grammar.Grammar):
+    lr1_table = palindrome.parse_table()
+    palindrome.mode = "pager"
+    table = palindrome.parse_table()
+    assert len(table) == 9
+    assert_lr1_equivalent(lr1_table, table)
+    palindrome.mode = "lalr1"
+    assert table == palindrome.parse_table()
+
+
+def test_pager_not_lalr():
+    grm = grammar.Grammar(not_lalr_rules())
+    lr1_table = grm.parse_table()
+    grm.mode = "pager"
+    table = grm.parse_table()
+    # The states after "a c" and "b c" are not merged, unlike LALR(1)
+    assert len(table) == len(lr1_table) == 14
+    assert_lr1_equivalent(lr1_table, table)
+
+    # Nested in palindromes, only the compatible states are merged
+    rules = not_lalr_rules() + [("S", ['"f"', 'S', '"f"']),
+                                ("S", ['"g"', 'S', '"g"'])]
+    grm = grammar.Grammar(rules)
+    lr1_table = grm.parse_table()
+    grm.mode = "pager"
+    table = grm.parse_table()
+    assert (len(table), len(lr1_table)) == (20, 52)
+    assert_lr1_equivalent(lr1_table, table)
+
+
+@pytest.mark.parametrize("name", ["grm", "re", "json"])
+def test_pager_equivalent(name: str):
+    from pypargen.grm.grammar import grammar as grm
+    from pypargen.grm import GrmParser
+    from pypargen.lexer.re import re_grm
+    if name == "json":
+        path = pathlib.Path(__file__).parents[2] / "examples" / "json.grm"
+        with open(path) as grm_file:
+            grm = GrmParser().parse(grm_file)
+    elif name == "re":
+        grm = re_grm
+    lr1_table = grammar.Grammar(grm, grm.start).parse_table()
+    pager = grammar.Grammar(grm, grm.start, "pager")
+    lalr1 = grammar.Grammar(grm, grm.start, "lalr1")
+    table = pager.parse_table()
+    assert len(table) == len(lalr1.parse_table()) < len(lr1_table)
+    assert_lr1_equivalent(lr1_table, table)
+
+
+@pytest.mark.parametrize("mode", grammar.Grammar.modes)
+def test_parallel(monkeypatch: pytest.MonkeyPatch, mode: str):
+    from pypargen.grm.grammar import grammar as grm
+    grm = grammar.Grammar(grm, grm.start, mode)
+    table = grm.parse_table()
+    monkeypatch.setattr(grammar, "PARALLEL_MIN_STATES", 1)
+    monkeypatch.setattr(grammar, "PARALLEL_CHUNK", 3)
+    assert grm.parse_table(workers=2) == table
+
+
+@pytest.mark.xfail(strict=True, raises=AssertionError)
+def test_invalid_mode():
+    grammar.Grammar([('S', ['"a"'])], mode="lr2")
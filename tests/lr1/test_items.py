@@ -0,0 +1,67 @@
+# Copyright 2021 Ilango Rajagopal
+# Licensed under GPL-3.0-only
+
+from pypargen.lr1 import grammar, items
+
+
+def test_cores(palindrome: grammar.Grammar):
+    interned = items.Items(palindrome)
+    # 4 + 4 + 2 cores for the rules, 2 for __root__ -> S
+    assert len(interned.rule) == 12
+    assert interned.offsets == [0, 4, 8, 10]
+    assert interned.next[1] == 'S'
+    assert interned.next_nt[1] == 0
+    assert interned.next_nt[0] == -1
+    assert interned.starts == [[0, 4, 8]]
+    assert interned.lookaheads == ['"a"', '"b"', '"c"', '$', '#']
+
+    item = interned.item(1, 3)
+    assert interned.decode(item) == ('S', ['"a"', 'S', '"a"'], 1, '$')
+    assert interned.decode(item + (1 << interned.shift)) == \
+        ('S', ['"a"', 'S', '"a"'], 2, '$')
+    assert not interned.done(item)
+    assert interned.done(interned.item(3, 0))
+
+
+def test_closure(sample_grammar: grammar.Grammar):
+    grm = sample_grammar
+    interned = items.Items(grm)
+
+    # Closure of every core with every lookahead is same as that of Items
+    for core in range(len(interned.rule)):
+        for la in range(len(interned.lookaheads) - 1):
+            item = interned.item(core, la)
+            closure = interned.closure([item])
+            readable = grm.closure([grammar.Item(*interned.decode(item))])
+            assert {grammar.Item(*interned.decode(x))
+                    for x in closure} == set(readable)
+
+            closure0 = interned.closure0([interned.item(core)])
+            assert {x >> interned.shift for x in closure0} == \
+                {x >> interned.shift for x in closure}
+
+
+def test_kernels(palindrome: grammar.Grammar):
+    interned = items.Items(palindrome)
+    root = interned.item(interned.offsets[interned.root], 3)
+    kernels, reductions, table = palindrome._automaton(
+        interned, root, interned.closure)
+    assert len(kernels) == len(reductions) == len(table) == 23
+    assert len(set(kernels)) == len(kernels)
+
+    # States are identified by kernel items, the rest is their closure
+    set_of_items = [interned.closure(kernel) for kernel in kernels]
+    for kernel, state, done in zip(kernels, set_of_items, reductions):
+        assert kernel <= state
+        assert set(done) == {x for x in state if interned.done(x)}
+        for item in kernel - {root}:
+            assert interned.pos[item >> interned.shift] > 0
+        for item in state - kernel:
+            assert interned.pos[item >> interned.shift] == 0
+
+    # Closure of the whole kernel is same as that of Items
+    for kernel, state in zip(kernels, set_of_items):
+        readable = palindrome.closure(
+            [grammar.Item(*interned.decode(x)) for x in kernel])
+        assert {grammar.Item(*interned.decode(x))
+                for x in state} == set(readable)
@@ -1,9 +1,25 @@
 # Copyright 2021 Ilango Rajagopal
 # Licensed under GPL-3.0-only
 
+import asyncio
 import io
 import pytest
 from pypargen.lr1 import parser, grammar
+from pypargen.base.lexer import BaseLexer, UnexpectedCharacter
+from pypargen.lexer import PyRELexer, PushPyRELexer, Lexer
+
+
+def nop(a):
+    return a
+
+
+def append_word(s, word):
+    s.append(word)
+    return s
+
+
+def first_word(word):
+    return [word]
 
 
 @pytest.fixture
@@ -17,7 +33,8 @@ def math():
     return grammar.Grammar(math_rules, "sub")
 
 
-def test_math(math: grammar.Grammar):
+@pytest.mark.parametrize("mode", grammar.Grammar.modes)
+def test_math(math: grammar.Grammar, mode: str):
     def convnum(a):
         return int(a)
 
@@ -43,13 +60,16 @@ def test_math(math: grammar.Grammar):
     input_str = "5+1-3*4/2"
     true_result = eval(input_str)
     inputbuf = io.StringIO(input_str)
+    math.mode = mode
     p = parser.Parser(math, functions)
     assert abs(p.parse(inputbuf) - true_result) <= 1e-6
 
 
-def test_palindrome():
+@pytest.mark.parametrize("mode", grammar.Grammar.modes)
+def test_palindrome(mode: str):
     palindrome = grammar.Grammar([('S', ['"a"', 'S', '"a"']),
-                                  ('S', ['"b"', 'S', '"b"']), ('S', ['"c"'])])
+                                  ('S', ['"b"', 'S', '"b"']), ('S', ['"c"'])],
+                                 mode=mode)
 
     def half(a, S=None, b=None):
         if b:
@@ -107,3 +127,209 @@ def test_eps_grammar():
 
     p = parser.Parser(g, [reducer] * len(g))
     assert p.parse(io.StringIO("ccc")) == [[], [[['c'], 'c'], 'c']]
+
+
+@pytest.fixture
+def words():
+    g = grammar.Grammar([('s', ['s', '"[a-z][a-z]*"']),
+                         ('s', ['"[a-z][a-z]*"'])])
+    return g, [append_word, first_word]
+
+
+@pytest.mark.parametrize("lexerClass", [PyRELexer, Lexer])
+def test_parse_file(words, lexerClass, tmp_path):
+    p = parser.Parser(*words, lexerClass, whitespaces=" \n")
+    path = tmp_path / "words.txt"
+    path.write_text("lorem ipsum dolor\n" * 1000 + "sit")
+    assert p.parse_file(path) == path.read_text().split()
+
+    path.write_text("")
+    with pytest.raises(EOFError):
+        p.parse_file(path)
+
+
+def test_parse_file_views(words, tmp_path):
+    p = parser.Parser(*words, whitespaces=" ")
+    path = tmp_path / "words.txt"
+    path.write_text("lorem ipsum dolor")
+
+    views = p.parse_file(path, decode=False)
+    assert all(isinstance(word, memoryview) for word in views)
+    assert [bytes(word) for word in views] == [b"lorem", b"ipsum", b"dolor"]
+    assert p.parse_file(path) == ["lorem", "ipsum", "dolor"]
+
+    p = parser.Parser(*words, Lexer, whitespaces=" ")
+    with pytest.raises(ValueError):
+        p.parse_file(path, decode=False)
+
+
+@pytest.mark.parametrize("lexerClass", [PyRELexer, Lexer])
+def test_parse_many(words, lexerClass):
+    p = parser.Parser(*words, lexerClass, whitespaces=" ")
+    documents = ["lorem ipsum", "dolor", "sit amet elit"]
+    results = p.parse_many(io.StringIO(doc) for doc in documents)
+    assert list(results) == [doc.split() for doc in documents]
+
+    session = p.session()
+    assert session.parse(io.StringIO("a b")) == ["a", "b"]
+    lexer = session.lexer
+    with pytest.raises(EOFError):
+        session.parse(io.StringIO(""))
+    # Errors leave the session usable
+    assert session.parse(io.StringIO("c")) == ["c"]
+    assert session.lexer is lexer
+    assert not session.stacks[1]
+
+
+@pytest.mark.parametrize("lexerClass", [PyRELexer, Lexer])
+def test_parse_many_workers(words, lexerClass, tmp_path):
+    p = parser.Parser(*words, lexerClass, " ")
+    path = tmp_path / "words.txt"
+    path.write_text("lorem ipsum")
+    documents = [f"word{'s' * i}" * (i % 3 + 1) for i in range(20)]
+    documents = [doc.replace("d", "d ") for doc in documents]
+
+    def inputs():
+        return documents + [path, b"dolor sit", io.StringIO("amet")]
+
+    expected = [doc.split() for doc in documents]
+    expected += [["lorem", "ipsum"], ["dolor", "sit"], ["amet"]]
+
+    assert list(p.parse_many(inputs())) == expected
+    results = p.parse_many(inputs(), workers=2, chunksize=3, prefetch=1)
+    assert list(results) == expected
+    results = p.parse_many(inputs(), workers=2, ordered=False)
+    assert sorted(results) == list(enumerate(expected))
+
+    # Inputs are read only as the results are consumed
+    consumed = []
+    results = p.parse_many((consumed.append(doc) or doc for doc in documents),
+                           workers=2, chunksize=2, prefetch=1)
+    assert next(results) == expected[0]
+    assert len(consumed) <= 4
+    results.close()
+
+
+def test_parse_many_workers_errors(words):
+    g, functions = words
+    p = parser.Parser(g, [append_word, lambda word: [word]], whitespaces=" ")
+    with pytest.raises(ValueError, match="not importable"):
+        p.parse_many(["a"], workers=2)
+
+    p = parser.Parser(g, functions, Lexer, " ")
+    for chunksize in (1, 3):
+        results = p.parse_many(["ab", "a1", "cd"], workers=2,
+                               chunksize=chunksize)
+        assert next(results) == ["ab"]
+        with pytest.raises(UnexpectedCharacter) as info:
+            next(results)
+        assert info.value.pos == 2
+
+
+@pytest.mark.parametrize("mode", grammar.Grammar.modes)
+def test_incremental(mode: str):
+    sums = grammar.Grammar([('s', ['s', '"-"', 'n']), ('s', ['n']),
+                            ('n', ['"[0-9][0-9]*"'])],
+                           mode=mode)
+    p = parser.Parser(sums, [lambda s, _, n: s - n, nop, int], Lexer, " ")
+    input_str = "150 - 12-3 - 45"
+
+    incremental = p.incremental()
+    for char in input_str:
+        incremental.feed(char)
+    assert incremental.close() == eval(input_str)
+
+    incremental.reset()
+    incremental.feed(input_str.encode())
+    # The last number may continue, the rest is reduced
+    assert incremental.stacks[1] == [None, 135, '-']
+    assert incremental.close() == eval(input_str)
+
+
+def test_incremental_pyre():
+    # Only re knows +
+    sums = grammar.Grammar([('s', ['s', '"-"', 'n']), ('s', ['n']),
+                            ('n', ['"[0-9]+"'])])
+    p = parser.Parser(sums, [lambda s, _, n: s - n, nop, int],
+                      whitespaces=" ")
+    input_str = "150 - 12-3 - 45"
+    assert p.parse(io.StringIO(input_str)) == eval(input_str)
+
+    incremental = p.incremental()
+    assert isinstance(incremental.lexer, PushPyRELexer)
+    for char in input_str:
+        incremental.feed(char.encode())
+    assert incremental.close() == eval(input_str)
+
+    with pytest.raises(TypeError):
+        parser.Parser(sums, [nop] * 3, BaseLexer).incremental()
+
+
+@pytest.mark.parametrize("lexerClass", [PyRELexer, Lexer])
+def test_incremental_errors(words, lexerClass):
+    p = parser.Parser(*words, lexerClass, " ")
+    incremental = p.incremental()
+    incremental.feed("ab c")
+    # PushPyRELexer waits for a full window or the end of the input
+    with pytest.raises(UnexpectedCharacter):
+        incremental.feed("d 1")
+        incremental.close()
+
+    incremental = p.incremental()
+    with pytest.raises(EOFError):
+        incremental.close()
+
+
+def test_parse_async(words):
+    p = parser.Parser(*words, whitespaces=" \n")
+
+    async def handle(reader, writer):
+        try:
+            result = ' '.join(await p.parse_async(reader, bufsize=7))
+        except (SyntaxError, EOFError, UnexpectedCharacter) as e:
+            result = type(e).__name__
+        writer.write(result.encode())
+        await writer.drain()
+        writer.close()
+
+    async def request(port, chunks):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        for chunk in chunks:
+            writer.write(chunk)
+            await writer.drain()
+            await asyncio.sleep(0)
+        writer.write_eof()
+        response = await reader.read()
+        writer.close()
+        return response.decode()
+
+    async def main():
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            return await asyncio.gather(
+                request(port, [b"lorem ips", b"um\n", b"dolor"]),
+                request(port, [b"sit ", b"amet "] * 50),
+                request(port, [b"a", b"b1"]),
+                request(port, []))
+
+    results = asyncio.run(main())
+    assert results == ["lorem ipsum dolor", "sit amet " * 49 + "sit amet",
+                       "UnexpectedCharacter", "EOFError"]
+
+
+@pytest.mark.parametrize("lexerClass", [PyRELexer, Lexer])
+def test_parse_async_sync(lexerClass):
+    # Terminals both regular expression engines know, and + for re
+    terminal = '"[a-z]+"' if lexerClass is PyRELexer else '"[a-z][a-z]*"'
+    g = grammar.Grammar([('s', ['s', terminal]), ('s', [terminal])])
+    p = parser.Parser(g, [append_word, first_word], lexerClass, " \n")
+    input_str = "lorem ipsum\ndolor sit amet " * 20
+
+    async def main():
+        reader = asyncio.StreamReader()
+        reader.feed_data(input_str.encode())
+        reader.feed_eof()
+        return await p.parse_async(reader, bufsize=5)
+
+    assert asyncio.run(main()) == p.parse(io.StringIO(input_str))
@@ -0,0 +1,39 @@
+# Copyright 2021 Ilango Rajagopal
+# Licensed under GPL-3.0-only
+
+import pytest
+from pypargen.lr1 import grammar, table
+
+
+def test_encode(palindrome: grammar.Grammar):
+    compiled = table.CompiledTable(palindrome, palindrome.parse_table())
+    assert compiled.encode(5) == 5
+    assert compiled.encode('r0') == -1
+    assert compiled.encode('r2') == -3
+    assert compiled.encode('c') == compiled.accept == -4
+    assert compiled.symbols == {'$': 0, '"a"': 1, '"b"': 2, '"c"': 3, 'S': 4}
+    assert list(compiled.rule_len) == [3, 3, 1]
+    assert list(compiled.rule_lhs) == [4, 4, 4]
+
+
+@pytest.mark.parametrize("mode", grammar.Grammar.modes)
+def test_actions(sample_grammar: grammar.Grammar, mode: str):
+    grm = grammar.Grammar(sample_grammar, sample_grammar.start, mode)
+    parse_table = grm.parse_table()
+    compiled = table.CompiledTable(grm, parse_table)
+    assert len(compiled) == len(parse_table)
+
+    # Every entry, including errors, must be same as in the parse table
+    for state, row in enumerate(parse_table):
+        for sym, idx in compiled.symbols.items():
+            action = compiled.action(state, idx)
+            if sym in row:
+                assert action == compiled.encode(row[sym])
+            else:
+                assert action == 0
+        assert compiled.expected[state] == [
+            sym for sym in row if sym.startswith('"')
+        ]
+
+    # Row displacement must be smaller than the full table
+    assert len(compiled.value) < len(parse_table) * len(compiled.symbols)